@@ -0,0 +1,164 @@
+"""
+Write-behind download log
+
+Downloads are recorded in an in-process buffer and written with bulk_create
+once S3CONNECTOR_ACCESS_LOG_BATCH_SIZE events are pending or
+S3CONNECTOR_ACCESS_LOG_FLUSH_SECONDS have passed, whichever comes first, so the
+download view itself never writes to the database. The aggregate_access_log
+management command later folds the raw events into File.download_count and
+File.last_accessed_at.
+
+Loss window: events still in the buffer when a worker is killed (SIGKILL, OOM,
+crash) are lost - at most one batch or one flush interval of downloads per
+worker. A normal shutdown flushes the buffer through atexit.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Max, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .routers import use_primary
+
+
+logger = logging.getLogger(__name__)
+
+
+class AccessLogBuffer:
+    """Thread-safe buffer of download events flushed in batches"""
+
+    def __init__(self, batch_size=100, flush_interval=5.0, background=True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.background = background
+        self._events = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+        self._pid = None
+
+    def record(self, file_id, user_id=None):
+        """Queue a download event; never touches the database in the calling thread"""
+        with self._lock:
+            self._events.append((file_id, user_id, timezone.now()))
+            pending = len(self._events)
+
+        if not self.background:
+            if pending >= self.batch_size:
+                self.flush()
+            return
+
+        self._ensure_flusher()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_flusher(self):
+        # Threads do not survive a fork, so every worker process starts its own
+        if self._flusher is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._flusher = threading.Thread(target=self._run, name='s3connector-access-log', daemon=True)
+            self._flusher.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing access log: {e}")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write all pending events with a single bulk_create; returns the number written"""
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return 0
+
+        from .models import File, FileAccessEvent
+
+        # Files deleted since the download would violate the foreign key. Ask the
+        # primary: a replica may not have the files uploaded moments ago yet.
+        with use_primary():
+            existing = set(
+                File.objects.filter(id__in={file_id for file_id, _, _ in events}).values_list('id', flat=True)
+            )
+            rows = [
+                FileAccessEvent(file_id=file_id, user_id=user_id, accessed_at=accessed_at)
+                for file_id, user_id, accessed_at in events
+                if file_id in existing
+            ]
+            FileAccessEvent.objects.bulk_create(rows, batch_size=self.batch_size)
+        logger.info(f"Flushed {len(rows)} access log events")
+        return len(rows)
+
+
+def aggregate_access_events(batch_size=1000):
+    """
+    Fold raw access events into the per-file counters and delete them
+
+    Each batch locks the exact event ids it counts and deletes only those, so
+    events flushed meanwhile (or not yet visible) wait for the next run instead
+    of being deleted uncounted. Everything reads from the primary: a lagging
+    replica would hide events that the delete on the primary then removes.
+
+    Args:
+        batch_size: Events counted and deleted per transaction
+
+    Returns:
+        int: Number of events aggregated
+    """
+    from .models import File, FileAccessEvent
+
+    aggregated = 0
+    with use_primary():
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    FileAccessEvent.objects.select_for_update()
+                    .order_by('id').values_list('id', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                events = FileAccessEvent.objects.filter(id__in=ids)
+
+                totals = events.values('file_id').annotate(count=Count('id'), last=Max('accessed_at')).order_by()
+                for row in totals:
+                    File.objects.filter(id=row['file_id']).update(
+                        download_count=F('download_count') + row['count'],
+                        last_accessed_at=Greatest(Coalesce('last_accessed_at', Value(row['last'])), Value(row['last'])),
+                    )
+                    aggregated += row['count']
+                events.delete()
+            if len(ids) < batch_size:
+                break
+
+    logger.info(f"Aggregated {aggregated} access log events")
+    return aggregated
+
+
+access_log = AccessLogBuffer(
+    batch_size=getattr(settings, 'S3CONNECTOR_ACCESS_LOG_BATCH_SIZE', 100),
+    flush_interval=getattr(settings, 'S3CONNECTOR_ACCESS_LOG_FLUSH_SECONDS', 5.0),
+)
+
+
+def _flush_on_exit():
+    try:
+        access_log.flush()
+    except Exception as e:
+        logger.error(f"Error flushing access log on exit: {e}")
+
+
+atexit.register(_flush_on_exit)
@@ -0,0 +1,143 @@
+"""
+Upload admission control
+
+Upload views marked with @upload_admission are admitted by AdmissionMiddleware
+before Django reads the request body, so a rejected upload costs no memory,
+temp disk or S3 connection. Each upload reserves one slot and its
+Content-Length in bytes, both globally and for its user; when any budget is
+exhausted the client gets an immediate 429 with Retry-After.
+
+Budgets are per worker process: with N workers the effective global limit is
+N times the configured one.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {
+    'global_uploads': 32,
+    'global_bytes': 4 * 1024 * 1024 * 1024,
+    'user_uploads': 4,
+    'user_bytes': 1024 * 1024 * 1024,
+    'retry_after': 5,
+}
+
+# Reserved for uploads that do not send Content-Length
+DEFAULT_UNKNOWN_SIZE = 500 * 1024 * 1024
+
+
+def upload_admission(view):
+    """Mark a view as an upload endpoint subject to admission control"""
+    view.upload_admission = True
+    return view
+
+
+class AdmissionController:
+    """Counts uploads and bytes in flight against global and per-user limits"""
+
+    def __init__(self, limits=None):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.bytes = 0
+        self._users = {}  # user id -> [uploads, bytes]
+        self.admitted = 0
+        self.rejected = 0
+
+    def try_acquire(self, user_id, size):
+        """Reserve an upload slot and size bytes; returns False without reserving if over a limit"""
+        with self._lock:
+            user_uploads, user_bytes = self._users.get(user_id, (0, 0))
+            if (self.uploads + 1 > self.limits['global_uploads']
+                    or self.bytes + size > self.limits['global_bytes']
+                    or user_uploads + 1 > self.limits['user_uploads']
+                    or user_bytes + size > self.limits['user_bytes']):
+                self.rejected += 1
+                return False
+            self.uploads += 1
+            self.bytes += size
+            self._users[user_id] = [user_uploads + 1, user_bytes + size]
+            self.admitted += 1
+            return True
+
+    def release(self, user_id, size):
+        with self._lock:
+            self.uploads -= 1
+            self.bytes -= size
+            user = self._users[user_id]
+            user[0] -= 1
+            user[1] -= size
+            if user[0] == 0:
+                del self._users[user_id]
+
+    def snapshot(self):
+        """Current counters, for monitoring"""
+        with self._lock:
+            return {
+                'uploads_in_flight': self.uploads,
+                'bytes_in_flight': self.bytes,
+                'active_users': len(self._users),
+                'admitted_total': self.admitted,
+                'rejected_total': self.rejected,
+                'limits': dict(self.limits),
+            }
+
+
+controller = AdmissionController(getattr(settings, 'S3CONNECTOR_UPLOAD_LIMITS', None))
+
+
+def _too_many(message, retry_after):
+    response = HttpResponse(message, status=429, content_type='text/plain')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+class AdmissionMiddleware:
+    """
+    Admit or reject uploads before the body is parsed
+
+    Must come after AuthenticationMiddleware. Nothing reads the body before
+    view middleware runs, so checking in __call__ happens before any upload
+    bytes are spooled.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.unknown_size = getattr(settings, 'S3CONNECTOR_MAX_UPLOAD_BYTES', DEFAULT_UNKNOWN_SIZE)
+
+    def _is_upload(self, request):
+        if request.method != 'POST':
+            return False
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return getattr(match.func, 'upload_admission', False)
+
+    def __call__(self, request):
+        if not self._is_upload(request) or not request.user.is_authenticated:
+            return self.get_response(request)
+
+        try:
+            size = int(request.META.get('CONTENT_LENGTH') or self.unknown_size)
+        except ValueError:
+            size = self.unknown_size
+
+        if size > controller.limits['user_bytes']:
+            return HttpResponse("Upload too large.", status=413, content_type='text/plain')
+
+        user_id = request.user.id
+        if not controller.try_acquire(user_id, size):
+            logger.warning(f"Upload of {size} bytes by user {user_id} rejected by admission control")
+            return _too_many("Too many uploads in progress, retry shortly.", controller.limits['retry_after'])
+
+        try:
+            return self.get_response(request)
+        finally:
+            controller.release(user_id, size)
@@ -4,3 +4,53 @@ from django.apps import AppConfig
 class S3ConnectorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 's3connector'
+
+    def ready(self):
+        # Connect cache invalidation signal handlers and register system checks
+        from . import checks, signals  # noqa: F401
+
+        # Table rebuilds in later migrations drop the SQLite search triggers
+        from django.db.models.signals import post_migrate
+        from .search import ensure_fts_triggers
+        post_migrate.connect(ensure_fts_triggers, sender=self)
+
+    def warm_up(self):
+        """
+        Pay import, client creation and signer setup at startup instead of on the first request
+
+        Called from the WSGI/ASGI entry points, so management commands never pay
+        for it. A server that loads the app before forking its workers (gunicorn
+        --preload) only shares the imports: each forked worker builds its own S3
+        client again right after the fork.
+        """
+        import logging
+        import os
+        import time
+
+        from django.conf import settings
+        if not getattr(settings, 'S3CONNECTOR_WARMUP', False):
+            return
+
+        logger = logging.getLogger(__name__)
+        start = time.perf_counter()
+        try:
+            # Modules the views import lazily
+            from . import (  # noqa: F401
+                accesslog, batch, cache, fileops, s3utils, search, uploadhandlers, zipstream
+            )
+            s3utils.warm_up()
+        except Exception as e:
+            logger.warning(f"S3 connector warm-up incomplete: {e}")
+            return
+        # Clients are per process (see s3utils.get_s3_client); rebuild in forked workers
+        os.register_at_fork(after_in_child=_warm_up_client)
+        logger.info(f"S3 connector warm-up took {(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+def _warm_up_client():
+    import logging
+    from . import s3utils
+    try:
+        s3utils.warm_up()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"S3 client warm-up after fork incomplete: {e}")
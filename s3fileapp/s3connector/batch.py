@@ -0,0 +1,253 @@
+import contextvars
+import logging
+import os
+import tarfile
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+
+from .uploadhandlers import UploadDigest
+
+
+logger = logging.getLogger(__name__)
+
+# Archive members smaller than this are expanded in memory, larger ones spill to disk
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class BatchItem:
+    """One file of a batch: where its bytes come from and what we know about it"""
+
+    def __init__(self, name, size, open_file, digest=None, path='', skipped=None):
+        self.name = name  # Unique within the batch, used for the S3 key
+        self.original_name = name  # Name shown in its folder
+        self.size = size
+        self._open_file = open_file
+        self.digest = digest
+        self.path = path  # Folder path inside an archive ("src/app"), '' for the top level
+        self.skipped = skipped  # Why the item is not uploaded, if it is not
+
+    @property
+    def display_path(self):
+        return f"{self.path}/{self.original_name}" if self.path else self.original_name
+
+    def open(self):
+        """Return (file object, digest), reading the source once if no digest exists yet"""
+        return self._open_file(self)
+
+
+def uploaded_file_items(uploaded_files, digests):
+    """BatchItems for files posted directly; their digests were computed while receiving them"""
+    for uploaded_file, digest in zip(uploaded_files, digests):
+        yield BatchItem(
+            uploaded_file.name, uploaded_file.size,
+            lambda item, f=uploaded_file: (f, item.digest), digest
+        )
+
+
+def _member_path(path):
+    """
+    Split an archive path into (folder path, filename)
+
+    Returns:
+        tuple: (folder path, filename, reason) where reason is set when the
+        member must be skipped: hidden files and folders, or paths escaping
+        the archive
+    """
+    parts = [part for part in path.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts:
+        return '', path, "empty name"
+    if '..' in parts:
+        return '', parts[-1], "path outside the archive"
+    if any(part.startswith('.') for part in parts):
+        return '/'.join(parts[:-1]), parts[-1], "hidden file"
+    return '/'.join(parts[:-1]), parts[-1], None
+
+
+def _spool(name, source):
+    """Expand one archive member into a spooled temp file, computing its digest on the way"""
+    digest = UploadDigest(name)
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    while True:
+        chunk = source.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        spooled.write(chunk)
+    spooled.seek(0)
+    wrapped = DjangoFile(spooled, name=name)
+    wrapped.size = digest.size
+    return wrapped, digest
+
+
+def archive_items(archive):
+    """
+    BatchItems for the regular files inside a zip or tar archive
+
+    Members are listed from the archive index without decompressing, so the
+    batch quota check sees the expanded size before any bytes are extracted.
+    Each item keeps its folder path; hidden and unsafe members are returned
+    marked as skipped so they still get a result.
+    """
+    archive.seek(0)
+    if zipfile.is_zipfile(archive):
+        archive.seek(0)
+        bundle = zipfile.ZipFile(archive)
+        members = [(info, info.filename, info.file_size) for info in bundle.infolist() if not info.is_dir()]
+        open_member = bundle.open
+    else:
+        archive.seek(0)
+        bundle = tarfile.open(fileobj=archive, mode='r:*')
+        members = [(info, info.name, info.size) for info in bundle.getmembers() if info.isfile()]
+        open_member = bundle.extractfile
+
+    items = []
+    for member, member_path, size in members:
+        path, name, skipped = _member_path(member_path)
+        items.append(BatchItem(
+            name, 0 if skipped else size,
+            lambda item, m=member: _spool(item.name, open_member(m)),
+            path=path, skipped=skipped,
+        ))
+    return items
+
+
+def unique_names(items):
+    """
+    Rename items sharing a name so parallel uploads cannot overwrite each other
+
+    S3 keys are flat, so names must be unique across the whole batch; the name
+    shown in the folder only changes when the duplicate is in the same folder.
+    """
+    # Every name in the batch is reserved up front, so a renamed duplicate cannot
+    # take a name that a later item already has ("a.txt", "a.txt", "a_1.txt")
+    items = [item for item in items if not item.skipped]
+    used = {item.name for item in items}
+    kept = set()
+    shown = set()
+    for item in items:
+        same_folder = (item.path, item.name) in shown
+        shown.add((item.path, item.name))
+        if item.name not in kept:
+            kept.add(item.name)
+            continue
+        base, dot, ext = item.name.rpartition('.')
+        count = 1
+        while True:
+            candidate = f"{base}_{count}.{ext}" if dot and base else f"{item.name}_{count}"
+            if candidate not in used:
+                break
+            count += 1
+        used.add(candidate)
+        item.name = candidate
+        if same_folder:
+            item.original_name = candidate
+    return items
+
+
+def _folder_for(user, root, path, folders):
+    """Find or create the Folder for an archive path below root, caching by path"""
+    from .models import Folder
+
+    if not path:
+        return root
+    if path not in folders:
+        parent_path, _, name = path.rpartition('/')
+        parent = _folder_for(user, root, parent_path, folders)
+        folders[path], _ = Folder.objects.get_or_create(owner=user, parent=parent, name=name)
+    return folders[path]
+
+
+def upload_batch(user, items, folder=None, max_workers=None):
+    """
+    Upload many files concurrently and create their File rows with one bulk_create
+
+    Sources are opened one at a time in the calling thread (archives cannot be
+    read concurrently) while up to max_workers S3 transfers run in parallel;
+    at most 2 * max_workers expanded files are held at once.
+
+    Args:
+        user: Owner of the new files (quota must already be checked)
+        items: BatchItems to upload
+        folder: Optional Folder for all files (archive folders are created inside it)
+        max_workers: Concurrent S3 transfers (defaults to S3CONNECTOR_BATCH_UPLOAD_WORKERS)
+
+    Returns:
+        list: One result dict per item, in order, with name (its path in an archive),
+        success, message and file_id; skipped items have message "skipped" and a reason
+    """
+    from .cache import bump_generation_on_commit
+    from .models import File
+    from .s3utils import S3Uploader
+
+    max_workers = max_workers or getattr(settings, 'S3CONNECTOR_BATCH_UPLOAD_WORKERS', 8)
+    uploader = S3Uploader()  # boto3 clients are thread-safe, one is shared by the pool
+    in_flight = threading.BoundedSemaphore(max_workers * 2)
+
+    def upload_one(item, file_obj, digest):
+        try:
+            return uploader.upload(file_obj, item.name, digest=digest)
+        except Exception as e:
+            return {"success": False, "message": f"Error uploading file: {e}"}
+        finally:
+            file_obj.close()
+            in_flight.release()
+
+    unique_names(items)
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3connector-batch') as pool:
+        for item in items:
+            if item.skipped:
+                futures.append((item, None, "skipped"))
+                continue
+            in_flight.acquire()
+            try:
+                file_obj, digest = item.open()
+            except Exception as e:
+                in_flight.release()
+                futures.append((item, None, f"Could not read file: {e}"))
+                continue
+            # Copy the context so the request profile still counts S3 calls made in the pool
+            future = pool.submit(contextvars.copy_context().run, upload_one, item, file_obj, digest)
+            futures.append((item, future, None))
+
+    results = []
+    records = []
+    folders = {}
+    for item, future, error in futures:
+        result = future.result() if future else {"success": False, "message": error}
+        entry = {"name": item.display_path, "success": result["success"], "message": result["message"], "file_id": None}
+        if item.skipped:
+            entry["reason"] = item.skipped
+        results.append(entry)
+        if result["success"]:
+            info = result["file_info"]
+            records.append((entry, File(
+                name=info["key"].split('/')[-1],
+                original_name=item.original_name,
+                s3_key=info["key"],
+                size=info["size_bytes"],
+                content_type=info["content_type"],
+                category=File.category_for_content_type(info["content_type"]),
+                checksum_sha256=info.get("checksum_sha256", ''),
+                checksum_crc32=info.get("checksum_crc32", ''),
+                owner=user,
+                # Archive folders are recreated below the target folder
+                folder=_folder_for(user, folder, item.path, folders),
+            )))
+
+    if records:
+        created = File.objects.bulk_create([record for _, record in records])
+        for (entry, _), record in zip(records, created):
+            entry["file_id"] = record.pk
+        # bulk_create sends no post_save signals
+        bump_generation_on_commit(user.id)
+
+    logger.info(f"Batch upload by {user}: {len(records)} of {len(results)} files uploaded")
+    return results
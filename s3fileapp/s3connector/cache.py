@@ -0,0 +1,102 @@
+"""
+Per-user cache generations
+
+Everything cached for a user is keyed by their current generation, and any
+change to their files, folders or quota bumps it. Invalidation is only as
+shared as the cache backend: with the default LocMemCache each worker process
+has its own counters, so a bump in one worker leaves the others serving their
+copy until S3CONNECTOR_CACHE_TIMEOUT. Deployments with more than one worker
+process need a shared backend (set REDIS_URL); `manage.py check --deploy`
+warns about this.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import use_primary
+
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 's3connector'
+
+# Cached entries only need to outlive the generation they belong to; a stale
+# generation is never read again and simply expires.
+DEFAULT_TIMEOUT = getattr(settings, 'S3CONNECTOR_CACHE_TIMEOUT', 300)
+
+
+def _generation_key(user_id):
+    return f"{KEY_PREFIX}:gen:{user_id}"
+
+
+def _fresh_generation():
+    """
+    Starting value for a missing counter
+
+    An evicted counter must not restart at a value it already had, or entries
+    cached under that earlier generation would be served again. Nanoseconds
+    since the epoch only move forward and are far ahead of any counter's bumps.
+    """
+    return time.time_ns()
+
+
+def get_generation(user_id):
+    """Return the user's current cache generation, starting a new counter if needed"""
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # add() so concurrent first requests agree on the starting value
+        seed = _fresh_generation()
+        cache.add(key, seed, timeout=None)
+        generation = cache.get(key, seed)
+    return generation
+
+
+def bump_generation(user_id):
+    """Invalidate everything cached for a user by moving to the next generation"""
+    key = _generation_key(user_id)
+    try:
+        generation = cache.incr(key)
+    except ValueError:
+        # Counter missing or evicted: any new value works as long as it is not reused
+        cache.add(key, _fresh_generation(), timeout=None)
+        generation = cache.incr(key)
+    logger.debug(f"Cache generation for user {user_id} is now {generation}")
+    return generation
+
+
+def bump_generation_on_commit(user_id):
+    """
+    Bump the user's generation once the current transaction commits (at once outside one)
+
+    Bumping earlier lets a concurrent request read the old rows after the bump
+    and cache them under the new generation, where they would stay until the
+    timeout.
+    """
+    transaction.on_commit(lambda: bump_generation(user_id))
+
+
+def cached_for_user(user_id, name, builder, timeout=DEFAULT_TIMEOUT):
+    """
+    Return a cached value for the user's current generation, building it on a miss
+
+    Args:
+        user_id: Owner of the cached data
+        name: Name of the fragment, unique per view and arguments
+        builder: Callable returning the value to cache (must be picklable)
+        timeout: Seconds to keep the entry
+
+    Returns:
+        The cached or freshly built value
+    """
+    key = f"{KEY_PREFIX}:{user_id}:{get_generation(user_id)}:{name}"
+    value = cache.get(key)
+    if value is None:
+        # A replica lagging behind the bump would store old rows under the new generation
+        with use_primary():
+            value = builder()
+        cache.set(key, value, timeout)
+    return value
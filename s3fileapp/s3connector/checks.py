@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Cache invalidation only reaches other worker processes through a shared backend"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith('LocMemCache'):
+        return [Warning(
+            "The default cache is LocMemCache, which is per process.",
+            hint=(
+                "With more than one worker, an upload in one worker does not invalidate cached "
+                "dashboards in the others for up to S3CONNECTOR_CACHE_TIMEOUT seconds. "
+                "Set REDIS_URL (or another shared backend) for multi-worker deployments."
+            ),
+            id='s3connector.W001',
+        )]
+    return []
@@ -0,0 +1,117 @@
+import logging
+import uuid
+
+from django.db import transaction
+
+from .cache import bump_generation_on_commit
+from .models import File, UserProfile
+
+
+logger = logging.getLogger(__name__)
+
+# Fields carried over from the source when a file is copied
+COPIED_FIELDS = ['original_name', 'size', 'content_type', 'category', 'checksum_sha256', 'checksum_crc32']
+
+
+def _copy_name(filename):
+    """
+    Name for a copy that no other object can have
+
+    Unlike the upload path's timestamp suffix, two copies made in the same
+    second still get different keys, so neither overwrites the other.
+    """
+    suffix = uuid.uuid4().hex[:12]
+    base, dot, ext = filename.rpartition('.')
+    return f"{base}_{suffix}.{ext}" if dot and base else f"{filename}_{suffix}"
+
+
+def _lock_profile(user):
+    """Lock the user's profile row so concurrent copies cannot both pass the quota check"""
+    return UserProfile.objects.select_for_update(of=('self',)).select_related('user').get(user=user)
+
+
+def copy_file(file, owner=None, folder=None):
+    """
+    Copy a file server-side into a user's space (a duplicate when owner and folder are unchanged)
+
+    Args:
+        file: The File to copy
+        owner: User receiving the copy (defaults to the file's owner)
+        folder: Folder of the copy, must belong to owner (defaults to no folder)
+
+    Returns:
+        dict: Result with success status, message and the new File
+    """
+    from .s3utils import copy_object_in_s3, delete_file_from_s3, get_s3_client
+
+    owner = owner or file.owner
+    try:
+        profile = owner.profile
+    except UserProfile.DoesNotExist:
+        return {"success": False, "message": f"{owner} has no storage space."}
+    if file.size > profile.get_available_storage():
+        return {"success": False, "message": "Not enough storage available."}
+
+    filename = _copy_name(file.s3_key.split('/')[-1])
+    dest_key = f"uploads/{filename}"
+    if not copy_object_in_s3(file.s3_key, dest_key, get_s3_client()):
+        return {"success": False, "message": "Error copying file in storage."}
+
+    with transaction.atomic():
+        # Re-check under the lock: the slow S3 copy ran without it
+        profile = _lock_profile(owner)
+        if file.size > profile.get_available_storage():
+            transaction.set_rollback(True)
+            new_file = None
+        else:
+            new_file = File.objects.create(
+                name=filename,
+                s3_key=dest_key,
+                owner=owner,
+                folder=folder,
+                **{field: getattr(file, field) for field in COPIED_FIELDS}
+            )
+
+    if new_file is None:
+        delete_file_from_s3(filename)
+        return {"success": False, "message": "Not enough storage available."}
+
+    logger.info(f"Copied file {file.id} to {new_file.id} for {owner}")
+    return {"success": True, "message": f"Copied {file.original_name}", "file": new_file}
+
+
+def move_file(file, owner=None, folder=None):
+    """
+    Move a file to another folder or another user's space
+
+    S3 keys do not encode the owner or folder, so a move only updates the File
+    row; no bytes are copied.
+
+    Args:
+        file: The File to move
+        owner: New owner (defaults to the current owner)
+        folder: Destination folder, must belong to owner (None for the root)
+
+    Returns:
+        dict: Result with success status, message and the File
+    """
+    previous_owner_id = file.owner_id
+    owner = owner or file.owner
+
+    with transaction.atomic():
+        if owner.id != previous_owner_id:
+            try:
+                profile = _lock_profile(owner)
+            except UserProfile.DoesNotExist:
+                return {"success": False, "message": f"{owner} has no storage space."}
+            if file.size > profile.get_available_storage():
+                return {"success": False, "message": "Not enough storage available."}
+        file.owner = owner
+        file.folder = folder
+        file.save(update_fields=['owner', 'folder', 'updated_at'])
+        if owner.id != previous_owner_id:
+            # post_save only invalidates the new owner's cached listings
+            bump_generation_on_commit(previous_owner_id)
+
+    logger.info(f"Moved file {file.id} to {owner} / {folder}")
+    return {"success": True, "message": f"Moved {file.original_name}", "file": file}
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from s3connector.accesslog import aggregate_access_events
+
+
+class Command(BaseCommand):
+    help = "Fold buffered download events into per-file download counts (run periodically, e.g. from cron)"
+
+    def handle(self, *args, **options):
+        aggregated = aggregate_access_events()
+        self.stdout.write(self.style.SUCCESS(f"Aggregated {aggregated} access events"))
@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter so imports and client creation are really cold
+CHILD_SCRIPT = r"""
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup_ms = (time.perf_counter() - start) * 1000
+
+from django.apps import apps
+start = time.perf_counter()
+apps.get_app_config('s3connector').warm_up()  # As wsgi.py does in a server
+warmup_ms = (time.perf_counter() - start) * 1000
+
+from django.conf import settings
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import get_resolver
+
+start = time.perf_counter()
+get_resolver().url_patterns  # Imports the URLconf and every view module
+urls_ms = (time.perf_counter() - start) * 1000
+
+setup_test_environment()
+settings.ALLOWED_HOSTS = ['testserver']
+client = Client(raise_request_exception=False)
+path, username, count = sys.argv[1], sys.argv[2], int(sys.argv[3])
+if username:
+    from django.contrib.auth.models import User
+    client.force_login(User.objects.get(username=username))
+
+latencies = []
+statuses = set()
+for _ in range(count):
+    start = time.perf_counter()
+    statuses.add(client.get(path).status_code)
+    latencies.append((time.perf_counter() - start) * 1000)
+
+print(json.dumps({
+    'setup_ms': setup_ms,
+    'warmup_ms': warmup_ms,
+    'urls_ms': urls_ms,
+    'latencies_ms': latencies,
+    'statuses': sorted(statuses),
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Report cold import time and first-request vs steady-state latency in a fresh process"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/admin/login/', help="URL to request (default: /admin/login/)")
+        parser.add_argument('--user', default='', help="Username to log in as for pages that need a login")
+        parser.add_argument('--requests', type=int, default=100, help="Number of requests to send")
+        parser.add_argument('--json', action='store_true', help="Print the raw measurements as JSON")
+
+    def handle(self, *args, **options):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 's3fileapp.settings')}
+        child = subprocess.run(
+            [sys.executable, '-c', CHILD_SCRIPT, options['path'], options['user'], str(options['requests'])],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if child.returncode != 0:
+            raise CommandError(f"Profiling process failed:\n{child.stderr}")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+            return
+
+        latencies = result['latencies_ms']
+        steady = sorted(latencies[1:]) or latencies
+        median = steady[len(steady) // 2]
+        self.stdout.write(f"django.setup():               {result['setup_ms']:8.1f} ms")
+        self.stdout.write(f"S3 connector warm-up:         {result['warmup_ms']:8.1f} ms")
+        self.stdout.write(f"URLconf and views import:     {result['urls_ms']:8.1f} ms")
+        self.stdout.write(f"First request:                {latencies[0]:8.1f} ms")
+        self.stdout.write(f"Median of the rest:           {median:8.1f} ms")
+        self.stdout.write(f"First / median:               {latencies[0] / median if median else 0:8.1f} x")
+        self.stdout.write(f"Status codes:                 {result['statuses']}")
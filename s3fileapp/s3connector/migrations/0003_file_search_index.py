@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+FTS_TABLE = 's3connector_file_fts'
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        original_name, content='s3connector_file', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON s3connector_file BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, original_name) VALUES (new.id, new.original_name);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON s3connector_file BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_name) VALUES ('delete', old.id, old.original_name);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF original_name ON s3connector_file BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_name) VALUES ('delete', old.id, old.original_name);
+        INSERT INTO {FTS_TABLE}(rowid, original_name) VALUES (new.id, new.original_name);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS file_original_name_trgm_idx ON s3connector_file USING gin (original_name gin_trgm_ops)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS file_original_name_trgm_idx",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_text_index(apps, schema_editor):
+    """SQLite gets an FTS5 trigram table, PostgreSQL a pg_trgm GIN index; other backends fall back to LIKE"""
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 34, 0):
+        _run(schema_editor, SQLITE_FORWARD)
+    elif connection.vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FORWARD)
+
+
+def drop_text_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        _run(schema_editor, SQLITE_REVERSE)
+    elif connection.vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('s3connector', '0002_file_checksums'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['owner', '-uploaded_at'], name='file_owner_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['owner', 'category'], name='file_owner_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['owner', 'content_type'], name='file_owner_type_idx'),
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:12
+
+from django.db import migrations
+
+
+FTS_TABLE = 's3connector_file_fts'
+
+# AddField on SQLite rebuilds s3connector_file, which drops the triggers created
+# in 0003; put them back and re-index the names written while they were missing
+SQLITE_FORWARD = [
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON s3connector_file BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, original_name) VALUES (new.id, new.original_name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON s3connector_file BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_name) VALUES ('delete', old.id, old.original_name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF original_name ON s3connector_file BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_name) VALUES ('delete', old.id, old.original_name);
+        INSERT INTO {FTS_TABLE}(rowid, original_name) VALUES (new.id, new.original_name);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+
+def restore_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+        for statement in SQLITE_FORWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('s3connector', '0005_file_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:40
+
+from django.db import migrations
+
+
+# Django compiles icontains/istartswith to UPPER("original_name"::text) LIKE UPPER(...),
+# which a trigram index on the bare column cannot serve; index the same expression
+POSTGRES_FORWARD = [
+    "DROP INDEX IF EXISTS file_original_name_trgm_idx",
+    "CREATE INDEX IF NOT EXISTS file_original_name_upper_trgm_idx "
+    "ON s3connector_file USING gin (UPPER(original_name::text) gin_trgm_ops)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS file_original_name_upper_trgm_idx",
+    "CREATE INDEX IF NOT EXISTS file_original_name_trgm_idx ON s3connector_file USING gin (original_name gin_trgm_ops)",
+]
+
+
+def _run(schema_editor, statements):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in statements:
+            schema_editor.execute(statement)
+
+
+def create_upper_index(apps, schema_editor):
+    _run(schema_editor, POSTGRES_FORWARD)
+
+
+def drop_upper_index(apps, schema_editor):
+    _run(schema_editor, POSTGRES_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('s3connector', '0006_file_search_triggers'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_upper_index, drop_upper_index),
+    ]
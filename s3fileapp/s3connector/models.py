@@ -42,6 +42,14 @@ class File(models.Model):
         ('other', 'Other'),
     ]
     
+    # Content type prefix -> category; anything containing a DOCUMENT_MARKERS entry is a document
+    CATEGORY_PREFIXES = [
+        ('image/', 'image'),
+        ('video/', 'video'),
+        ('audio/', 'audio'),
+    ]
+    DOCUMENT_MARKERS = ('pdf', 'document', 'spreadsheet')
+    
     name = models.CharField(max_length=255)
     original_name = models.CharField(max_length=255)  # Original filename before deduplication
     s3_key = models.CharField(max_length=1024)  # Full path in S3
@@ -51,15 +59,45 @@ class File(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='files')
     folder = models.ForeignKey(Folder, on_delete=models.SET_NULL, null=True, blank=True, related_name='files')
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Change marker for listing ETags (moves, renames)
+    checksum_sha256 = models.CharField(max_length=64, blank=True, default='')  # Hex digest computed while uploading
+    checksum_crc32 = models.CharField(max_length=12, blank=True, default='')  # Base64, verified by S3 on upload
+    download_count = models.BigIntegerField(default=0)  # Aggregated from FileAccessEvent
+    last_accessed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        # Listings and search always filter by owner, then sort by date or narrow by category
+        indexes = [
+            models.Index(fields=['owner', '-uploaded_at'], name='file_owner_uploaded_idx'),
+            models.Index(fields=['owner', 'category'], name='file_owner_category_idx'),
+            models.Index(fields=['owner', 'content_type'], name='file_owner_type_idx'),
+            models.Index(fields=['owner', 'updated_at'], name='file_owner_updated_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
+    @classmethod
+    def category_for_content_type(cls, content_type):
+        """Map a content type to one of CATEGORY_CHOICES"""
+        for prefix, category in cls.CATEGORY_PREFIXES:
+            if content_type.startswith(prefix):
+                return category
+        if any(marker in content_type for marker in cls.DOCUMENT_MARKERS):
+            return 'document'
+        return 'other'
+    
     def get_download_url(self):
         """Generate a download URL for this file"""
         from s3connector.s3utils import create_download_link
         return create_download_link(self.s3_key)
     
+class FileAccessEvent(models.Model):
+    """A single download, written in batches by s3connector.accesslog and folded into File counters"""
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='access_events')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    accessed_at = models.DateTimeField()
+    
 class FilePermission(models.Model):
     PERMISSION_CHOICES = [
         ('private', 'Private'),
@@ -0,0 +1,180 @@
+import codecs
+import csv
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 's3connector:preview'
+
+# S3 keys are never overwritten in this app (duplicates get a new name), so the
+# key -> ETag mapping can live as long as the previews themselves
+PREVIEW_TIMEOUT = 24 * 60 * 60
+
+TABULAR_TYPES = {'text/csv', 'text/tab-separated-values'}
+TABULAR_EXTENSIONS = ('.csv', '.tsv')
+
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+]
+
+
+def preview_bytes():
+    return getattr(settings, 'S3CONNECTOR_PREVIEW_BYTES', 64 * 1024)
+
+
+def detect_encoding(data, offset=0):
+    """
+    Guess the text encoding of a chunk that may start or end mid-character
+
+    Args:
+        data: The bytes fetched
+        offset: Position of data in the object, so UTF-16 is read on whole code units
+
+    Returns:
+        tuple: (encoding, bytes to skip before the first character: a BOM or
+        half a UTF-16 code unit) or (None, 0) for binary data
+    """
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            return encoding, len(bom)
+
+    # An odd offset lands inside a UTF-16 code unit: look from the next one
+    lead = offset % 2
+    sample = data[lead:lead + 4096]
+    if b'\x00' in sample:
+        # UTF-16 without a BOM: ASCII text has a NUL in every other byte
+        even_nuls = sample[0::2].count(0)
+        odd_nuls = sample[1::2].count(0)
+        half = max(len(sample) // 2, 1)
+        if odd_nuls > half * 0.6 and even_nuls < half * 0.1:
+            return 'utf-16-le', lead
+        if even_nuls > half * 0.6 and odd_nuls < half * 0.1:
+            return 'utf-16-be', lead
+        return None, 0
+
+    # A range can begin mid-character: skip up to three UTF-8 continuation bytes
+    head = 0
+    while head < min(3, len(data)) and 0x80 <= data[head] <= 0xBF:
+        head += 1
+    try:
+        # Incremental decode tolerates a character cut at the end of the range
+        codecs.getincrementaldecoder('utf-8')().decode(data[head:], final=False)
+        return 'utf-8', 0
+    except UnicodeDecodeError:
+        return 'cp1252', 0
+
+
+def _is_tabular(file):
+    return file.content_type in TABULAR_TYPES or file.original_name.lower().endswith(TABULAR_EXTENSIONS)
+
+
+def _parse_rows(lines):
+    """Split lines into cells, sniffing the delimiter from the lines themselves"""
+    sample = '\n'.join(lines[:20])
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+    return list(csv.reader(lines, dialect))
+
+
+def _find_newline(data, newline, skip, unit, reverse=False):
+    """Position of the first (or last) newline on a code unit boundary after skip, or -1"""
+    find = data.rfind if reverse else data.find
+    lo, hi = skip, len(data)
+    while True:
+        position = find(newline, lo, hi)
+        if position == -1 or (position - skip) % unit == 0:
+            return position
+        # Matched across two UTF-16 code units: keep looking
+        if reverse:
+            hi = position + len(newline) - 1
+        else:
+            lo = position + 1
+
+
+def render_preview(file, chunk):
+    """
+    Turn a fetched byte range into whole lines (and rows for CSV/TSV files)
+
+    Partial lines at either end of the range are dropped unless the range
+    touches the start or end of the object; next_start and prev_start give the
+    offsets of the neighbouring pages.
+    """
+    data = chunk['data']
+    offset = chunk['start']
+    total_size = chunk['total_size']
+    at_start = offset == 0
+    at_end = offset + len(data) >= total_size
+
+    encoding, skip = detect_encoding(data, offset)
+    if encoding is None:
+        return {'binary': True, 'total_size': total_size}
+
+    unit = 2 if encoding.startswith('utf-16') else 1
+    newline = '\n'.encode(encoding)
+    first = _find_newline(data, newline, skip, unit)
+    last = _find_newline(data, newline, skip, unit, reverse=True)
+    body_start = skip if at_start else first + len(newline)
+    body_end = len(data) if at_end else last + len(newline)
+    if (not at_start and first == -1) or (not at_end and last == -1) or body_end <= body_start:
+        # A single line longer than the range: show it cut rather than nothing,
+        # on whole code units so UTF-16 is not decoded from half a character
+        body_start = skip
+        body_end = len(data) if at_end else skip + (len(data) - skip) // unit * unit
+
+    text = data[body_start:body_end].decode(encoding, errors='replace')
+    lines = text.splitlines()
+    page_size = preview_bytes()
+
+    return {
+        'binary': False,
+        'encoding': encoding,
+        'lines': lines,
+        'rows': _parse_rows(lines) if _is_tabular(file) else None,
+        'start': offset + body_start,
+        'end': offset + body_end,
+        'total_size': total_size,
+        'next_start': None if at_end else offset + body_end,
+        'prev_start': None if at_start else max(0, offset + body_start - page_size),
+    }
+
+
+def get_preview(file, start=0, tail=False):
+    """
+    Preview part of a file using a ranged GET of S3CONNECTOR_PREVIEW_BYTES
+
+    Args:
+        file: The File to preview
+        start: Byte offset of the page (ignored when tail is set)
+        tail: Preview the end of the file instead
+
+    Returns:
+        dict: See render_preview
+    """
+    from .s3utils import fetch_range_from_s3
+
+    size = preview_bytes()
+    page = 'tail' if tail else start
+    etag_key = f"{KEY_PREFIX}:etag:{file.s3_key}"
+
+    etag = cache.get(etag_key)
+    if etag:
+        preview = cache.get(f"{KEY_PREFIX}:{etag}:{size}:{page}")
+        if preview is not None:
+            return preview
+
+    chunk = fetch_range_from_s3(file.s3_key, None if tail else start, size)
+    preview = render_preview(file, chunk)
+
+    if chunk['etag']:
+        cache.set(etag_key, chunk['etag'], PREVIEW_TIMEOUT)
+        cache.set(f"{KEY_PREFIX}:{chunk['etag']}:{size}:{page}", preview, PREVIEW_TIMEOUT)
+    logger.info(f"Previewed {len(chunk['data'])} bytes of {file.s3_key} at {page}")
+    return preview
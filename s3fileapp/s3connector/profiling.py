@@ -0,0 +1,121 @@
+import contextvars
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-S3Connector-Profile'
+
+_current_profile = contextvars.ContextVar('s3connector_profile', default=None)
+
+
+class RequestProfile:
+    """Counters collected while a single request is handled"""
+
+    def __init__(self):
+        self.view_name = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.s3_calls = 0
+        self.started = time.perf_counter()
+        self.wall_time = None
+
+    def finish(self):
+        self.wall_time = time.perf_counter() - self.started
+
+    def as_header(self):
+        return (
+            f"view={self.view_name}; queries={self.queries}; db_ms={self.db_time * 1000:.1f}; "
+            f"s3_calls={self.s3_calls}; wall_ms={self.wall_time * 1000:.1f}"
+        )
+
+
+def current_profile():
+    """Return the profile of the request being handled, or None outside a profiled request"""
+    return _current_profile.get()
+
+
+def record_s3_call(**kwargs):
+    """botocore 'before-call' handler counting S3 API calls against the current request"""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.s3_calls += 1
+
+
+def instrument_client(client):
+    """Count every API call made through an S3 client; returns the client for chaining"""
+    # Presigned URLs are signed locally and do not count as calls
+    client.meta.events.register('before-call.s3', record_s3_call)
+    return client
+
+
+def _query_timer(execute, sql, params, many, context):
+    profile = _current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.db_time += time.perf_counter() - start
+
+
+class ProfilingMiddleware:
+    """
+    Record SQL queries, DB time, S3 calls and wall time for each view
+
+    The profile is logged for every request and, when DEBUG or
+    S3CONNECTOR_PROFILE_HEADER is set, returned in the X-S3Connector-Profile header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.add_header = getattr(settings, 'S3CONNECTOR_PROFILE_HEADER', settings.DEBUG)
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_query_timer))
+                response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        profile.finish()
+
+        if request.resolver_match is not None:
+            profile.view_name = request.resolver_match.view_name
+        logger.info(f"Profile {request.method} {request.path}: {profile.as_header()}")
+        if self.add_header:
+            response[PROFILE_HEADER] = profile.as_header()
+        return response
+
+
+@contextmanager
+def query_budget(max_queries, using='default'):
+    """
+    Fail if the block runs more than max_queries SQL queries
+
+    Usage in tests:
+        with query_budget(3):
+            self.client.get(url)
+    """
+    from django.test.utils import CaptureQueriesContext
+    
+    with CaptureQueriesContext(connections[using]) as captured:
+        yield captured
+    executed = len(captured.captured_queries)
+    if executed > max_queries:
+        queries = '\n'.join(
+            f"{i}. {query['sql']}" for i, query in enumerate(captured.captured_queries, start=1)
+        )
+        raise AssertionError(
+            f"{executed} queries executed, budget is {max_queries}:\n{queries}"
+        )
@@ -0,0 +1,126 @@
+import contextvars
+import functools
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+# Cookie telling later requests from the same client to keep reading from the primary
+PIN_COOKIE = 's3c_primary'
+
+_pinned = contextvars.ContextVar('s3connector_db_pinned', default=False)
+_wrote = contextvars.ContextVar('s3connector_db_wrote', default=False)
+_replica_ok = contextvars.ContextVar('s3connector_db_replica_ok', default=False)
+
+
+def read_replicas():
+    """Database aliases that serve reads (empty on single-node setups)"""
+    return getattr(settings, 'S3CONNECTOR_READ_REPLICAS', [])
+
+
+@contextmanager
+def use_primary():
+    """Send every read in the block to the primary database"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextmanager
+def use_replica():
+    """Allow s3connector reads in the block to go to a read replica"""
+    token = _replica_ok.set(True)
+    try:
+        yield
+    finally:
+        _replica_ok.reset(token)
+
+
+def replica_reads(view):
+    """
+    Let a read-only listing, search or API view read from a replica
+
+    Only for views where data a few seconds old is harmless: quota checks and
+    cache builders must see the primary.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Route opted-in s3connector reads to a read replica and everything else to the primary
+
+    Reads go to the primary unless they run inside use_replica() (see
+    replica_reads), so quota checks and cache builders never see a lagging
+    copy. Once a request writes, its remaining reads go to the primary so it
+    always sees its own changes; ReplicaPinningMiddleware extends that to the
+    redirect that follows (replication lag would otherwise hide the upload).
+    """
+
+    app_label = 's3connector'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label or not _replica_ok.get():
+            return None
+        if _pinned.get() or _wrote.get():
+            return None
+        replicas = read_replicas()
+        if not replicas:
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas mirror the primary, so objects from any of them can be related
+        databases = {'default', *read_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in read_replicas():
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Reset routing state per request and keep a client on the primary for a
+    short while after it writes (S3CONNECTOR_REPLICA_PIN_SECONDS)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'S3CONNECTOR_REPLICA_PIN_SECONDS', 5)
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        pinned_token = _pinned.set(pinned_until > time.time())
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+
+        if wrote and read_replicas():
+            response.set_cookie(
+                PIN_COOKIE, str(time.time() + self.pin_seconds),
+                max_age=self.pin_seconds, httponly=True, samesite='Lax'
+            )
+        return response
@@ -2,21 +2,46 @@ import boto3 # Amazon's official Python package for working with AWS services
 import mimetypes # To guess the MIME type of a file based on its filename
 import requests # For making HTTP requests to the presigned URL
 from django.conf import settings
-from botocore.exceptions import ClientError # Catch AWS specific errors
+from botocore.exceptions import BotoCoreError, ClientError # Catch AWS specific errors
 import logging
+import os
 import time 
+from .profiling import instrument_client
 
 
 
 logger = logging.getLogger(__name__) 
 
+_clients = {}
+
 def get_s3_client():
-    # creating and returning s3 client
-    return boto3.client(
-        's3',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME
+    # Creating a client is expensive (endpoint rules, credentials), so one per process
+    # is reused; boto3 clients are thread-safe. Keyed by pid so forked workers never
+    # share a connection pool with their parent.
+    pid = os.getpid()
+    if pid not in _clients:
+        _clients.clear()
+        _clients[pid] = instrument_client(boto3.client(
+            's3',
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=settings.AWS_S3_REGION_NAME
+        ))
+    return _clients[pid]
+
+def warm_up():
+    """
+    Do the one-off work of the first S3 request now: build the client, resolve
+    credentials, load the signer and endpoint rules, and read the mimetypes tables
+    """
+    mimetypes.init()
+    s3_client = get_s3_client()
+    # Presigning runs credential resolution, endpoint resolution and signing
+    # locally without calling S3
+    s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': settings.AWS_STORAGE_BUCKET_NAME or 'warm-up', 'Key': 'warm-up'},
+        ExpiresIn=60
     )
     
 class S3Uploader:
@@ -30,15 +55,12 @@ class S3Uploader:
     
     def _get_s3_client(self):
         """Create and return an S3 client"""
-        return boto3.client(
-            's3',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME
-        )
+        return get_s3_client()
     
-    def _get_content_type(self, filename):
-        """Determine the content type from the filename"""
+    def _get_content_type(self, filename, digest=None):
+        """Determine the content type from the sniffed magic bytes, falling back to the filename"""
+        if digest is not None:
+            return digest.content_type
         content_type, _ = mimetypes.guess_type(filename)
         if content_type is None:
             content_type = 'application/octet-stream'
@@ -70,7 +92,25 @@ class S3Uploader:
             # File doesn't exist, use original name
             return filename
     
-    def upload(self, file_obj, filename, folder="uploads", max_size_mb=500, large_file_threshold_mb=100):
+    def _checksum_args(self, digest):
+        """S3 arguments asking the server to verify the upload against our checksum"""
+        if digest is None:
+            return {}
+        return {'ChecksumCRC32': digest.crc32}
+    
+    def _file_info(self, object_key, content_type, file_obj, digest):
+        """Build the file_info dict returned by the upload methods"""
+        file_info = {
+            "key": object_key,
+            "content_type": content_type,
+            "size_bytes": file_obj.size
+        }
+        if digest is not None:
+            file_info["checksum_sha256"] = digest.sha256
+            file_info["checksum_crc32"] = digest.crc32
+        return file_info
+    
+    def upload(self, file_obj, filename, folder="uploads", max_size_mb=500, large_file_threshold_mb=100, digest=None):
         """
         Upload a file to S3 with duplicate handling
         
@@ -80,6 +120,7 @@ class S3Uploader:
             folder: Folder path in the bucket (defaults to "uploads")
             max_size_mb: Maximum file size allowed (defaults to 500MB)
             large_file_threshold_mb: Size threshold to use different upload method (defaults to 100MB)
+            digest: Optional UploadDigest; its checksum is verified by S3 and its sniffed type is used
             
         Returns:
             dict: Upload result with success status and file info
@@ -104,16 +145,18 @@ class S3Uploader:
             return self.upload_large_file(
                 file_obj=file_obj,
                 filename=unique_filename,
-                folder=folder
+                folder=folder,
+                digest=digest
             )
         else:
             return self.upload_small_file(
                 file_obj=file_obj,
                 filename=unique_filename,
-                folder=folder
+                folder=folder,
+                digest=digest
             )
     
-    def upload_small_file(self, file_obj, filename, folder="uploads"):
+    def upload_small_file(self, file_obj, filename, folder="uploads", digest=None):
         """
         Upload smaller files directly using upload_fileobj
         
@@ -121,11 +164,12 @@ class S3Uploader:
             file_obj: The file object to upload
             filename: Name to give the file in S3 (already checked for duplicates)
             folder: Folder path in the bucket
+            digest: Optional UploadDigest for content type and checksum
             
         Returns:
             dict: Upload result
         """
-        content_type = self._get_content_type(filename)
+        content_type = self._get_content_type(filename, digest)
         object_key = f"{folder}/{filename}"
         
         try:
@@ -133,7 +177,7 @@ class S3Uploader:
                 file_obj,
                 self.bucket_name,
                 object_key,
-                ExtraArgs={'ContentType': content_type}
+                ExtraArgs={'ContentType': content_type, **self._checksum_args(digest)}
             )
             
             self.logger.info(f"Successfully uploaded {filename} to {folder}")
@@ -142,18 +186,14 @@ class S3Uploader:
                 "success": True,
                 "message": f"Successfully uploaded {filename}",
                 "method": "standard",
-                "file_info": {
-                    "key": object_key,
-                    "content_type": content_type,
-                    "size_bytes": file_obj.size
-                }
+                "file_info": self._file_info(object_key, content_type, file_obj, digest)
             }
         except ClientError as e:
             error_message = f"Error uploading file to S3: {e}"
             self.logger.error(error_message)
             return {"success": False, "message": error_message}
     
-    def upload_large_file(self, file_obj, filename, folder="uploads"):
+    def upload_large_file(self, file_obj, filename, folder="uploads", digest=None):
         """
         Upload larger files using presigned URL (backend handles it)
         
@@ -161,25 +201,34 @@ class S3Uploader:
             file_obj: The file object to upload
             filename: Name to give the file in S3 (already checked for duplicates)
             folder: Folder path in the bucket
+            digest: Optional UploadDigest for content type and checksum
             
         Returns:
             dict: Upload result
         """
-        content_type = self._get_content_type(filename)
+        content_type = self._get_content_type(filename, digest)
         object_key = f"{folder}/{filename}"
         
         try:
+            checksum_args = self._checksum_args(digest)
+            
             # Generate a presigned URL for PUT operation
             presigned_url = self.s3_client.generate_presigned_url(
                 'put_object',
                 Params={
                     'Bucket': self.bucket_name,
                     'Key': object_key,
-                    'ContentType': content_type
+                    'ContentType': content_type,
+                    **checksum_args
                 },
                 ExpiresIn=3600  # URL expires in 1 hour
             )
             
+            headers = {'Content-Type': content_type}
+            if checksum_args:
+                # S3 rejects the PUT if the body does not match this checksum
+                headers['x-amz-checksum-crc32'] = checksum_args['ChecksumCRC32']
+            
             # Reset file pointer to beginning
             file_obj.seek(0)
             
@@ -187,7 +236,7 @@ class S3Uploader:
             response = requests.put(
                 presigned_url,
                 data=file_obj,
-                headers={'Content-Type': content_type}
+                headers=headers
             )
             
             if response.status_code == 200:
@@ -197,11 +246,7 @@ class S3Uploader:
                     "success": True,
                     "message": f"Successfully uploaded large file {filename}",
                     "method": "presigned_url",
-                    "file_info": {
-                        "key": object_key,
-                        "content_type": content_type,
-                        "size_bytes": file_obj.size
-                    }
+                    "file_info": self._file_info(object_key, content_type, file_obj, digest)
                 }
             else:
                 error_message = f"Error in presigned URL upload: {response.status_code} - {response.text}"
@@ -257,6 +302,96 @@ def create_download_link(filename):
         logger.error(f"Error generating presigned URL: {e}")
         return None
 
+def stream_file_from_s3(key, chunk_size=1024 * 1024, s3_client=None):
+    """
+    Yield the bytes of an S3 object in chunks without loading it into memory
+    
+    Args:
+        key: Full S3 key of the object
+        chunk_size: Bytes per chunk
+        s3_client: Optional client to reuse across many objects
+    """
+    s3_client = s3_client or get_s3_client()
+    response = s3_client.get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+    body = response['Body']
+    try:
+        yield from body.iter_chunks(chunk_size)
+    finally:
+        body.close()
+
+def copy_object_in_s3(source_key, dest_key, s3_client=None):
+    """
+    Copy an object inside the bucket without the bytes passing through this server
+    
+    Objects up to the multipart threshold use a single CopyObject; larger ones are
+    split into parts copied in parallel with UploadPartCopy (CopyObject itself
+    stops at 5GB).
+    
+    Returns:
+        bool: True if the copy succeeded
+    """
+    from boto3.exceptions import S3TransferFailedError
+    from boto3.s3.transfer import TransferConfig
+    
+    s3_client = s3_client or get_s3_client()
+    config = TransferConfig(
+        multipart_threshold=settings.S3CONNECTOR_COPY_PART_SIZE,
+        multipart_chunksize=settings.S3CONNECTOR_COPY_PART_SIZE,
+        max_concurrency=settings.S3CONNECTOR_COPY_CONCURRENCY,
+    )
+    try:
+        s3_client.copy(
+            {'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Key': source_key},
+            settings.AWS_STORAGE_BUCKET_NAME,
+            dest_key,
+            Config=config
+        )
+        logger.info(f"Copied {source_key} to {dest_key}")
+        return True
+    except (ClientError, BotoCoreError, S3TransferFailedError) as e:
+        # BotoCoreError covers connection and endpoint failures, S3TransferFailedError failed parts
+        logger.error(f"Error copying {source_key} to {dest_key}: {e}")
+        return False
+
+def fetch_range_from_s3(key, start=None, length=None, s3_client=None):
+    """
+    Fetch part of an S3 object with a ranged GET
+    
+    Args:
+        key: Full S3 key of the object
+        start: First byte to fetch; None fetches the last `length` bytes
+        length: Number of bytes to fetch
+        s3_client: Optional client to reuse
+        
+    Returns:
+        dict: data, start (offset of data in the object), total_size and etag
+    """
+    s3_client = s3_client or get_s3_client()
+    byte_range = f"bytes=-{length}" if start is None else f"bytes={start}-{start + length - 1}"
+    try:
+        response = s3_client.get_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=key,
+            Range=byte_range
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'InvalidRange':
+            raise
+        # Range starts past the end of the object (e.g. an empty file)
+        return {"data": b'', "start": start or 0, "total_size": start or 0, "etag": None}
+    
+    # Content-Range: bytes 100-199/12345
+    content_range = response.get('ContentRange', '')
+    first, _, total = content_range.replace('bytes ', '').partition('/')
+    first = first.split('-')[0]
+    data = response['Body'].read()
+    return {
+        "data": data,
+        "start": int(first) if first.isdigit() else (start or 0),
+        "total_size": int(total) if total.isdigit() else len(data),
+        "etag": response.get('ETag'),
+    }
+
 def delete_file_from_s3(filename):
     """Delete a file from S3 bucket"""
     s3_client = get_s3_client()
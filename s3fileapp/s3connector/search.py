@@ -0,0 +1,225 @@
+import logging
+
+from django.core.paginator import Paginator
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
+
+from .models import File
+
+
+logger = logging.getLogger(__name__)
+
+# SQLite FTS5 table (trigram tokenizer) mirroring File.original_name, kept current by triggers
+FTS_TABLE = 's3connector_file_fts'
+
+# Any later migration that rebuilds s3connector_file on SQLite (AddField,
+# AlterField, ...) drops these; ensure_fts_triggers puts them back after migrate
+FTS_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON s3connector_file BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, original_name) VALUES (new.id, new.original_name);
+    END""",
+    f'{FTS_TABLE}_ad': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON s3connector_file BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_name) VALUES ('delete', old.id, old.original_name);
+    END""",
+    f'{FTS_TABLE}_au': f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF original_name ON s3connector_file BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_name) VALUES ('delete', old.id, old.original_name);
+        INSERT INTO {FTS_TABLE}(rowid, original_name) VALUES (new.id, new.original_name);
+    END""",
+}
+
+# Trigram indexes can only answer substring queries of at least three characters
+MIN_INDEXED_QUERY_LENGTH = 3
+
+# (label, min bytes inclusive, max bytes exclusive) for the size facet
+SIZE_BUCKETS = [
+    ('under_1mb', None, 1024 * 1024),
+    ('1mb_10mb', 1024 * 1024, 10 * 1024 * 1024),
+    ('10mb_100mb', 10 * 1024 * 1024, 100 * 1024 * 1024),
+    ('over_100mb', 100 * 1024 * 1024, None),
+]
+
+_fts_available = None
+
+
+def _missing_fts_triggers(using=DEFAULT_DB_ALIAS):
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 's3connector_file'"
+        )
+        present = {name for name, in cursor.fetchall()}
+    return set(FTS_TRIGGERS) - present
+
+
+def fts_available():
+    """
+    Check (once per process) whether the SQLite FTS index exists and is kept current
+
+    Without its triggers the index goes stale, so searches fall back to LIKE
+    rather than silently missing files.
+    """
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+        if _fts_available and _missing_fts_triggers():
+            logger.warning(f"{FTS_TABLE} triggers are missing, searching without the index; run migrate")
+            _fts_available = False
+    return _fts_available
+
+
+def ensure_fts_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Recreate missing FTS triggers and re-index the names written without them
+
+    Connected to post_migrate so schema changes to File cannot leave the index stale.
+
+    Returns:
+        bool: Whether anything had to be repaired
+    """
+    global _fts_available
+    conn = connections[using]
+    if conn.vendor != 'sqlite' or FTS_TABLE not in conn.introspection.table_names():
+        return False
+    missing = _missing_fts_triggers(using)
+    if not missing:
+        return False
+
+    with conn.cursor() as cursor:
+        for name in sorted(missing):
+            cursor.execute(FTS_TRIGGERS[name])
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _fts_available = None
+    logger.warning(f"Recreated {FTS_TABLE} triggers {sorted(missing)} and rebuilt the index")
+    return True
+
+
+def _fts_phrase(query):
+    """Quote user input as a single FTS5 phrase so operators in it are not interpreted"""
+    return '"{}"'.format(query.replace('"', '""'))
+
+
+def _size_filter(min_size=None, max_size=None):
+    q = Q()
+    if min_size is not None:
+        q &= Q(size__gte=min_size)
+    if max_size is not None:
+        q &= Q(size__lt=max_size)
+    return q
+
+
+def search_queryset(user, query='', prefix=False, category=None, content_type=None,
+                    min_size=None, max_size=None, uploaded_after=None, uploaded_before=None):
+    """
+    Build the queryset of a user's files matching a search
+
+    Args:
+        user: Owner of the files
+        query: Text to find in File.original_name
+        prefix: Match only names starting with query (otherwise substring)
+        category: Restrict to one of File.CATEGORY_CHOICES
+        content_type: Restrict to an exact content type, or a family such as "image/"
+        min_size, max_size: Size range in bytes (max exclusive)
+        uploaded_after, uploaded_before: Aware datetimes bounding the upload time (before exclusive)
+
+    Returns:
+        QuerySet: Matching files, newest first
+    """
+    files = File.objects.filter(owner=user)
+    query = (query or '').strip()
+
+    if query:
+        if len(query) >= MIN_INDEXED_QUERY_LENGTH and fts_available():
+            # Let the trigram index narrow the candidates, keeping only the owner's
+            # rows inside the subquery so the IN list never holds other users' files.
+            # The index itself is shared: MATCH still walks every user's matches for
+            # the trigrams, so very common fragments ("pdf") cost more on big databases.
+            # CROSS JOIN pins the order: one MATCH, then a primary key lookup per hit
+            # (otherwise SQLite may rerun the MATCH for every file the owner has).
+            files = files.filter(id__in=RawSQL(
+                f"SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} "
+                f"CROSS JOIN s3connector_file AS owned ON owned.id = {FTS_TABLE}.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s AND owned.owner_id = %s",
+                [_fts_phrase(query), user.pk]
+            ))
+        if prefix:
+            files = files.filter(original_name__istartswith=query)
+        else:
+            # Compiles to UPPER(original_name) LIKE UPPER(%...%); on PostgreSQL the
+            # pg_trgm GIN index on UPPER(original_name) serves it (migration 0007)
+            files = files.filter(original_name__icontains=query)
+
+    if category:
+        files = files.filter(category=category)
+    if content_type:
+        if content_type.endswith('/'):
+            files = files.filter(content_type__startswith=content_type)
+        else:
+            files = files.filter(content_type=content_type)
+
+    files = files.filter(_size_filter(min_size, max_size))
+    if uploaded_after:
+        files = files.filter(uploaded_at__gte=uploaded_after)
+    if uploaded_before:
+        files = files.filter(uploaded_at__lt=uploaded_before)
+
+    return files.select_related('folder', 'permission').order_by('-uploaded_at', '-id')
+
+
+def facet_counts(files, top_content_types=10):
+    """
+    Count matches per category, content type and size bucket
+
+    Args:
+        files: Queryset returned by search_queryset
+        top_content_types: How many content types to report
+
+    Returns:
+        dict: {"category": {...}, "content_type": {...}, "size": {...}}
+    """
+    files = files.order_by()
+    categories = {
+        row['category']: row['count']
+        for row in files.values('category').annotate(count=Count('id'))
+    }
+    content_types = {
+        row['content_type']: row['count']
+        for row in files.values('content_type').annotate(count=Count('id')).order_by('-count')[:top_content_types]
+    }
+    # All size buckets in a single aggregate query
+    sizes = files.aggregate(**{
+        label: Count('id', filter=_size_filter(low, high))
+        for label, low, high in SIZE_BUCKETS
+    })
+    return {
+        'category': categories,
+        'content_type': content_types,
+        'size': sizes,
+    }
+
+
+def search_files(user, page=1, per_page=50, with_facets=True, **filters):
+    """
+    Run a search and return one page of results with facet counts
+
+    Args:
+        user: Owner of the files
+        page: 1-based page number (out of range pages return the last page)
+        per_page: Results per page
+        with_facets: Whether to compute facet counts
+        **filters: Passed to search_queryset
+
+    Returns:
+        dict: page (a Django Page), facets and the total number of matches
+    """
+    files = search_queryset(user, **filters)
+    paginator = Paginator(files, per_page)
+    result = {
+        'page': paginator.get_page(page),
+        'total': paginator.count,
+        'facets': facet_counts(files) if with_facets else None,
+    }
+    logger.info(f"Search for {filters.get('query')!r} by {user} matched {result['total']} files")
+    return result
@@ -0,0 +1,40 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .cache import bump_generation_on_commit
+from .models import UserProfile, Folder, File, FilePermission
+
+
+@receiver([post_save, post_delete], sender=File)
+@receiver([post_save, post_delete], sender=Folder)
+def invalidate_owner_cache(sender, instance, **kwargs):
+    """Uploads, deletes and folder changes alter the owner's listings"""
+    bump_generation_on_commit(instance.owner_id)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_profile_cache(sender, instance, **kwargs):
+    """Quota changes alter the dashboard storage figures"""
+    bump_generation_on_commit(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=FilePermission)
+def invalidate_permission_cache(sender, instance, **kwargs):
+    bump_generation_on_commit(instance.file.owner_id)
+
+
+@receiver(m2m_changed, sender=FilePermission.shared_users.through)
+def invalidate_sharing_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    """Sharing changes affect the owner and every user added or removed"""
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # instance is a User, pk_set holds FilePermission ids
+        bump_generation_on_commit(instance.pk)
+        owner_ids = FilePermission.objects.filter(pk__in=pk_set or []).values_list('file__owner_id', flat=True)
+        for owner_id in set(owner_ids):
+            bump_generation_on_commit(owner_id)
+    else:
+        bump_generation_on_commit(instance.file.owner_id)
+        for user_id in pk_set or []:
+            bump_generation_on_commit(user_id)
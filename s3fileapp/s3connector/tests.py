@@ -1,3 +1,853 @@
-from django.test import TestCase
+import base64
+import codecs
+import contextvars
+import datetime
+import hashlib
+import io
+import json
+import warnings
+import zipfile
+import zlib
+from unittest import mock
 
-# Create your tests here.
+from boto3.exceptions import S3TransferFailedError
+from botocore.exceptions import EndpointConnectionError
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Model
+from django.db.models.query import QuerySet
+from django.core.paginator import Page
+from django.http import HttpResponse, QueryDict
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.utils import timezone
+
+from . import views
+from . import search
+from .search import ensure_fts_triggers, fts_available, search_files, search_queryset
+from .s3utils import S3Uploader, copy_object_in_s3
+from .uploadhandlers import ChecksumUploadHandler, UploadDigest, get_upload_digest, sniff_content_type
+from .admission import AdmissionController
+from .cache import _generation_key, bump_generation, cached_for_user, get_generation
+from .batch import BatchItem, unique_names
+from .accesslog import AccessLogBuffer, aggregate_access_events
+from .fileops import copy_file, move_file
+from .models import UserProfile, Folder, File, FileAccessEvent, FilePermission
+from .preview import detect_encoding, get_preview, render_preview
+from .profiling import PROFILE_HEADER, query_budget
+from .routers import ReplicaRouter, use_primary, use_replica
+
+
+def render_like_template(request, template_name, context=None):
+    """
+    Stand-in for render() that touches what the templates do: every file's
+    folder and permission. Lazy relations show up as extra queries here.
+    """
+    for value in (context or {}).values():
+        if isinstance(value, (list, QuerySet, Page)):
+            items = value
+        elif isinstance(value, Model):
+            items = [value]
+        else:
+            continue
+        for item in items:
+            if isinstance(item, File):
+                str(item.folder)
+                try:
+                    item.permission
+                except FilePermission.DoesNotExist:
+                    pass
+    return HttpResponse(template_name)
+
+
+class SniffContentTypeTests(SimpleTestCase):
+
+    def test_magic_bytes_override_filename(self):
+        self.assertEqual(sniff_content_type(b'\x89PNG\r\n\x1a\n' + b'0' * 8, 'photo.jpg'), 'image/png')
+        self.assertEqual(sniff_content_type(b'%PDF-1.7', None), 'application/pdf')
+
+    def test_weak_signatures_defer_to_filename(self):
+        self.assertEqual(sniff_content_type(b'BMW,2020,blue\n', 'cars.csv'), 'text/csv')
+        self.assertEqual(sniff_content_type(b'ID3 tags to fix', 'notes.txt'), 'text/plain')
+        self.assertEqual(sniff_content_type(b'ID3\x04\x00', 'song.mp3'), 'audio/mpeg')
+        self.assertEqual(sniff_content_type(b'BM6\x00\x00\x00', 'scan'), 'image/bmp')
+
+
+class ChecksumUploadTests(TestCase):
+
+    DATA = b'%PDF-1.7 checksum me' * 100
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pw')
+        UserProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.crc32 = base64.b64encode(zlib.crc32(self.DATA).to_bytes(4, 'big')).decode('ascii')
+        self.sha256 = hashlib.sha256(self.DATA).hexdigest()
+
+    def post(self, path, data):
+        # The handler's digests must be used; reading the file again would hide a mismatch
+        with mock.patch.object(UploadDigest, 'from_file', side_effect=AssertionError("digest not matched")):
+            return self.client.post(path, data)
+
+    def s3_client(self):
+        s3_client = mock.Mock()
+        s3_client.head_object.side_effect = Exception('Not Found')  # No existing object
+        return s3_client
+
+    def test_digest_format(self):
+        digest = UploadDigest('doc')
+        digest.update(self.DATA[:7])
+        digest.update(self.DATA[7:])
+        self.assertEqual(digest.crc32, self.crc32)
+        self.assertEqual(len(base64.b64decode(digest.crc32)), 4)
+        self.assertEqual(digest.sha256, self.sha256)
+        self.assertEqual((digest.size, digest.content_type), (len(self.DATA), 'application/pdf'))
+
+    @mock.patch('s3connector.views.render', render_like_template)
+    def test_upload_sends_and_stores_checksums(self):
+        s3_client = self.s3_client()
+        with mock.patch('s3connector.s3utils.get_s3_client', return_value=s3_client):
+            self.post('/upload/', {'file': SimpleUploadedFile('doc', self.DATA)})
+
+        extra_args = s3_client.upload_fileobj.call_args.kwargs['ExtraArgs']
+        self.assertEqual(extra_args, {'ContentType': 'application/pdf', 'ChecksumCRC32': self.crc32})
+        file = File.objects.get()
+        self.assertEqual((file.checksum_crc32, file.checksum_sha256), (self.crc32, self.sha256))
+
+    @override_settings(S3CONNECTOR_READ_REPLICAS=['replica0'])
+    def test_quota_check_reads_primary(self):
+        # 'replica0' is not a configured database: any read routed there raises
+        with mock.patch('s3connector.s3utils.get_s3_client', return_value=self.s3_client()):
+            response = self.client.post('/upload/', {'file': SimpleUploadedFile('doc', self.DATA)})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(File.objects.exists())
+
+    def test_batch_matches_digests_by_index(self):
+        other = b'second file'
+        s3_client = self.s3_client()
+        with mock.patch('s3connector.s3utils.get_s3_client', return_value=s3_client):
+            self.post('/upload/batch/', {
+                'files': [SimpleUploadedFile('a.pdf', self.DATA), SimpleUploadedFile('b.txt', other)],
+            })
+        checksums = dict(File.objects.values_list('original_name', 'checksum_sha256'))
+        self.assertEqual(checksums, {'a.pdf': self.sha256, 'b.txt': hashlib.sha256(other).hexdigest()})
+
+    def test_digest_size_mismatch_reads_file(self):
+        handler = ChecksumUploadHandler()
+        stale = UploadDigest('a')
+        stale.update(b'other bytes')
+        handler.digests['file'] = [stale]
+        request = mock.Mock(upload_handlers=[handler])
+        digest = get_upload_digest(request, 'file', SimpleUploadedFile('a', self.DATA))
+        self.assertEqual(digest.sha256, self.sha256)
+
+    @mock.patch('s3connector.s3utils.requests.put')
+    def test_presigned_put_carries_checksum(self, put):
+        put.return_value.status_code = 200
+        s3_client = self.s3_client()
+        with mock.patch('s3connector.s3utils.get_s3_client', return_value=s3_client):
+            digest = UploadDigest('doc')
+            digest.update(self.DATA)
+            result = S3Uploader().upload_large_file(SimpleUploadedFile('doc', self.DATA), 'doc', digest=digest)
+
+        self.assertTrue(result['success'])
+        params = s3_client.generate_presigned_url.call_args.kwargs['Params']
+        self.assertEqual(params['ChecksumCRC32'], self.crc32)
+        self.assertEqual(put.call_args.kwargs['headers']['x-amz-checksum-crc32'], self.crc32)
+
+
+@mock.patch('s3connector.views.render', render_like_template)
+class ViewQueryBudgetTests(TestCase):
+    """Query budgets for every s3connector view; an N+1 regression fails these"""
+
+    FILE_COUNT = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='pw')
+        UserProfile.objects.create(user=cls.user)
+        cls.folders = [
+            Folder.objects.create(name=f"folder{i}", owner=cls.user) for i in range(3)
+        ]
+        cls.subfolder = Folder.objects.create(name='sub', owner=cls.user, parent=cls.folders[0])
+        for i in range(cls.FILE_COUNT):
+            file = File.objects.create(
+                name=f"report{i}.pdf",
+                original_name=f"report{i}.pdf",
+                s3_key=f"uploads/report{i}.pdf",
+                size=1024 * i,
+                content_type='application/pdf',
+                category='document',
+                owner=cls.user,
+                folder=cls.folders[i % 3],
+            )
+            if i % 2:
+                FilePermission.objects.create(file=file, permission_type='public')
+        cls.file = File.objects.filter(owner=cls.user).first()
+
+    def setUp(self):
+        cache.clear()
+        fts_available()  # Checked once per process, keep it out of the budgets
+        self.factory = RequestFactory()
+
+    def _request(self, method='get', path='/', data=None, user=None):
+        request = getattr(self.factory, method)(path, data or {})
+        request.user = user or self.user
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        return request
+
+    def assertBudget(self, max_queries, view, *args, method='get', data=None, user=None):
+        request = self._request(method, data=data, user=user)
+        with query_budget(max_queries):
+            response = view(request, *args)
+            if response.streaming:
+                b''.join(response.streaming_content)
+
+    def s3_client(self):
+        s3_client = mock.Mock()
+        s3_client.head_object.side_effect = Exception('Not Found')
+        return s3_client
+
+    def test_dashboard(self):
+        self.assertBudget(3, views.dashboard_view)
+
+    def test_dashboard_cached(self):
+        views.dashboard_view(self._request())
+        self.assertBudget(0, views.dashboard_view)
+
+    def test_file_list(self):
+        self.assertBudget(1, views.file_list_view)
+        self.assertBudget(1, views.file_list_view, 'document')
+
+    def test_search(self):
+        self.assertBudget(5, views.search_view, data={'q': 'report'})
+
+    def test_file_detail(self):
+        self.assertBudget(3, views.file_detail_view, self.file.id)
+
+    def test_folder(self):
+        self.assertBudget(3, views.folder_view, self.folders[0].id)
+
+    def test_upload_form(self):
+        self.assertBudget(1, views.upload_file_view)
+
+    def test_create_folder_form(self):
+        self.assertBudget(1, views.create_folder_view)
+
+    def test_download(self):
+        with mock.patch('s3connector.s3utils.create_download_link', return_value='https://example.com/f'), \
+                mock.patch('s3connector.accesslog.access_log', AccessLogBuffer(background=False)):
+            self.assertBudget(1, views.download_file_view, self.file.id)
+
+    def test_delete_file(self):
+        with mock.patch('s3connector.s3utils.delete_file_from_s3', return_value=True):
+            self.assertBudget(4, views.delete_file_view, self.file.id, method='post')
+
+    def test_delete_folder(self):
+        self.assertBudget(6, views.delete_folder_view, self.subfolder.id, method='post')
+
+    def test_register(self):
+        self.assertBudget(0, views.register, user=AnonymousUser())
+        data = {'username': 'new', 'password1': 'a-long-pass-phrase', 'password2': 'a-long-pass-phrase'}
+        self.assertBudget(9, views.register, method='post', data=data, user=AnonymousUser())
+
+    def test_login_logout(self):
+        self.assertBudget(0, views.login_view, user=AnonymousUser())
+        self.user.set_password('pw')
+        self.user.save()
+        self.assertBudget(6, views.login_view, method='post', data={'username': 'owner', 'password': 'pw'}, user=AnonymousUser())
+        self.assertBudget(0, views.logout_view)
+
+    def test_upload(self):
+        with mock.patch('s3connector.s3utils.get_s3_client', return_value=self.s3_client()):
+            self.assertBudget(3, views.upload_file_view, method='post', data={
+                'file': SimpleUploadedFile('new.txt', b'hello'), 'folder': self.folders[0].id,
+            })
+
+    def test_batch_upload(self):
+        files = [SimpleUploadedFile(f"new{i}.txt", b'hello') for i in range(5)]
+        with mock.patch('s3connector.s3utils.get_s3_client', return_value=self.s3_client()):
+            self.assertBudget(3, views.batch_upload_view, method='post', data={
+                'files': files, 'folder': self.folders[0].id,
+            })
+
+    def test_create_folder(self):
+        self.assertBudget(2, views.create_folder_view, method='post', data={
+            'folder_name': 'new', 'parent_folder': self.folders[0].id,
+        })
+
+    @override_settings(S3CONNECTOR_PREVIEW_BYTES=64)
+    def test_preview(self):
+        chunk = {'data': b'line\n' * 10, 'start': 0, 'total_size': 50, 'etag': '"abc"'}
+        with mock.patch('s3connector.s3utils.fetch_range_from_s3', return_value=chunk):
+            self.assertBudget(1, views.file_preview_view, self.file.id)
+
+    def test_copy(self):
+        with mock.patch('s3connector.s3utils.get_s3_client'), \
+                mock.patch('s3connector.s3utils.copy_object_in_s3', return_value=True):
+            self.assertBudget(8, views.copy_file_view, self.file.id, method='post', data={'folder': self.folders[1].id})
+
+    def test_move(self):
+        self.assertBudget(5, views.move_file_view, self.file.id, method='post', data={'folder': self.folders[1].id})
+
+    def test_download_folder(self):
+        def fake_stream(key, chunk_size, s3_client=None):
+            yield b'data'
+
+        with mock.patch('s3connector.s3utils.get_s3_client'), \
+                mock.patch('s3connector.s3utils.stream_file_from_s3', fake_stream):
+            self.assertBudget(3, views.download_folder_view, self.folders[0].id)
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='pw')
+        cls.other = User.objects.create_user('other', password='pw')
+        specs = [
+            ('report-2024.pdf', 'application/pdf', 'document', 500),
+            ('annual report.pdf', 'application/pdf', 'document', 2 * 1024 * 1024),
+            ('reportage.png', 'image/png', 'image', 20 * 1024 * 1024),
+            ('holiday.jpg', 'image/jpeg', 'image', 300),
+            ('a.txt', 'text/plain', 'document', 10),
+        ]
+        for name, content_type, category, size in specs:
+            File.objects.create(
+                name=name, original_name=name, s3_key=f"uploads/{name}", size=size,
+                content_type=content_type, category=category, owner=cls.user,
+            )
+        File.objects.create(
+            name='report.pdf', original_name='report.pdf', s3_key='uploads/other-report.pdf', size=1,
+            content_type='application/pdf', category='document', owner=cls.other,
+        )
+
+    def setUp(self):
+        search._fts_available = None
+
+    def names(self, **filters):
+        return sorted(search_queryset(self.user, **filters).values_list('original_name', flat=True))
+
+    def test_index_is_maintained(self):
+        self.assertTrue(fts_available())
+        self.assertFalse(ensure_fts_triggers())  # Nothing dropped them during migrate
+
+    def test_substring_and_prefix(self):
+        self.assertEqual(self.names(query='REPORT'), ['annual report.pdf', 'report-2024.pdf', 'reportage.png'])
+        self.assertEqual(self.names(query='port-20'), ['report-2024.pdf'])
+        self.assertEqual(self.names(query='report', prefix=True), ['report-2024.pdf', 'reportage.png'])
+        self.assertEqual(self.names(query='"; DROP'), [])
+
+    def test_short_queries_use_like(self):
+        self.assertEqual(self.names(query='jp'), ['holiday.jpg'])
+        self.assertEqual(self.names(query='a', prefix=True), ['a.txt', 'annual report.pdf'])
+
+    def test_filters(self):
+        self.assertEqual(self.names(category='image'), ['holiday.jpg', 'reportage.png'])
+        self.assertEqual(self.names(content_type='image/'), ['holiday.jpg', 'reportage.png'])
+        self.assertEqual(self.names(content_type='image/png'), ['reportage.png'])
+        self.assertEqual(self.names(min_size=1000, max_size=10 * 1024 * 1024), ['annual report.pdf'])
+
+        new_year = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+        File.objects.filter(original_name='holiday.jpg').update(uploaded_at=new_year - datetime.timedelta(days=180))
+        self.assertEqual(self.names(uploaded_before=new_year), ['holiday.jpg'])
+        self.assertNotIn('holiday.jpg', self.names(uploaded_after=new_year))
+
+    def test_view_date_filters(self):
+        request = RequestFactory().get('/search/')
+        request.user = self.user
+        today = timezone.localdate()
+
+        def search(**params):
+            request.GET = QueryDict(mutable=True)
+            request.GET.update(params)
+            with mock.patch('s3connector.views.render') as render, warnings.catch_warnings():
+                warnings.simplefilter('error')  # Naive datetimes in filters warn under USE_TZ
+                views.search_view(request)
+            return render.call_args.args[2]['total']
+
+        self.assertEqual(search(before=today.isoformat()), 5)  # Today's uploads included
+        self.assertEqual(search(after=today.isoformat()), 5)
+        self.assertEqual(search(after=(today + datetime.timedelta(days=1)).isoformat()), 0)
+        self.assertEqual(search(before=today.isoformat(), after='bad'), 5)
+
+    def test_facets_and_pagination(self):
+        result = search_files(self.user, per_page=2, page=2, query='report')
+        self.assertEqual(result['total'], 3)
+        self.assertEqual(len(result['page']), 1)
+        self.assertEqual(result['facets']['category'], {'document': 2, 'image': 1})
+        self.assertEqual(result['facets']['content_type'], {'application/pdf': 2, 'image/png': 1})
+        self.assertEqual(result['facets']['size'], {'under_1mb': 1, '1mb_10mb': 1, '10mb_100mb': 1, 'over_100mb': 0})
+
+    def test_index_follows_writes(self):
+        file = File.objects.create(
+            name='budget.xlsx', original_name='budget.xlsx', s3_key='uploads/budget.xlsx', size=1,
+            content_type='application/vnd.ms-excel', owner=self.user,
+        )
+        self.assertEqual(self.names(query='budget'), ['budget.xlsx'])
+        file.original_name = 'forecast.xlsx'
+        file.save()
+        self.assertEqual(self.names(query='budget'), [])
+        self.assertEqual(self.names(query='forecast'), ['forecast.xlsx'])
+        file.delete()
+        self.assertEqual(self.names(query='forecast'), [])
+
+    def test_dropped_triggers_are_repaired(self):
+        with connection.cursor() as cursor:
+            for name in search.FTS_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER {name}")
+        File.objects.create(
+            name='missed.txt', original_name='missed.txt', s3_key='uploads/missed.txt', size=1,
+            content_type='text/plain', owner=self.user,
+        )
+        # A stale index must not hide files: fall back to LIKE until repaired
+        self.assertFalse(fts_available())
+        self.assertEqual(self.names(query='missed'), ['missed.txt'])
+
+        self.assertTrue(ensure_fts_triggers())
+        self.assertTrue(fts_available())
+        self.assertEqual(self.names(query='missed'), ['missed.txt'])
+
+
+class CacheGenerationTests(SimpleTestCase):
+
+    def test_evicted_counter_never_reuses_a_generation(self):
+        cache.clear()
+        first = get_generation(1)
+        bumped = bump_generation(1)
+        self.assertGreater(bumped, first)
+
+        cache.delete(_generation_key(1))  # Evicted
+        self.assertGreater(get_generation(1), bumped)
+        cache.delete(_generation_key(1))
+        self.assertGreater(bump_generation(1), bumped)
+
+
+class CacheInvalidationTests(TestCase):
+
+    def test_bumped_after_commit(self):
+        user = User.objects.create_user('owner', password='pw')
+        before = get_generation(user.id)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            File.objects.create(
+                name='a.txt', original_name='a.txt', s3_key='uploads/a.txt', size=1,
+                content_type='text/plain', owner=user,
+            )
+            # Not before commit: a concurrent read would cache the old rows under the new generation
+            self.assertEqual(get_generation(user.id), before)
+        self.assertEqual(len(callbacks), 1)
+        self.assertGreater(get_generation(user.id), before)
+
+
+@mock.patch('s3connector.views.render', render_like_template)
+class ProfilingMiddlewareTests(TestCase):
+
+    def test_profile_header(self):
+        user = User.objects.create_user('owner', password='pw')
+        self.client.force_login(user)
+        with self.settings(S3CONNECTOR_PROFILE_HEADER=True):
+            response = self.client.get('/files/')
+        profile = response[PROFILE_HEADER]
+        self.assertIn('view=file_list', profile)
+        self.assertIn('queries=', profile)
+        self.assertIn('s3_calls=0', profile)
+
+
+class ReplicaRouterTests(SimpleTestCase):
+
+    def route(self, steps):
+        # A fresh context, as each request gets from ReplicaPinningMiddleware
+        return contextvars.Context().run(steps, ReplicaRouter())
+
+    @override_settings(S3CONNECTOR_READ_REPLICAS=['replica0'])
+    def test_reads_default_to_primary(self):
+        self.assertIsNone(self.route(lambda router: router.db_for_read(File)))
+
+    @override_settings(S3CONNECTOR_READ_REPLICAS=['replica0'])
+    def test_opted_in_reads_go_to_replica_until_a_write(self):
+        def steps(router):
+            with use_replica():
+                routes = [router.db_for_read(File), router.db_for_read(User)]
+                routes.append(router.db_for_write(File))
+                routes.append(router.db_for_read(File))
+            return routes
+        self.assertEqual(self.route(steps), ['replica0', None, 'default', None])
+
+    @override_settings(S3CONNECTOR_READ_REPLICAS=['replica0'])
+    def test_use_primary(self):
+        def steps(router):
+            with use_replica(), use_primary():
+                return router.db_for_read(File)
+        self.assertIsNone(self.route(steps))
+
+    @override_settings(S3CONNECTOR_READ_REPLICAS=['replica0'])
+    def test_cache_builders_read_primary(self):
+        cache.clear()
+
+        def steps(router):
+            with use_replica():
+                return cached_for_user(1, 'route', lambda: router.db_for_read(File))
+        self.assertIsNone(self.route(steps))
+
+    def test_single_node(self):
+        self.assertIsNone(self.route(lambda router: router.db_for_read(File)))
+
+
+class AccessLogTests(TestCase):
+
+    def test_buffer_and_aggregate(self):
+        user = User.objects.create_user('owner', password='pw')
+        file = File.objects.create(
+            name='a.txt', original_name='a.txt', s3_key='uploads/a.txt',
+            size=1, content_type='text/plain', owner=user,
+        )
+        buffer = AccessLogBuffer(batch_size=3, background=False)
+
+        with self.assertNumQueries(0):
+            buffer.record(file.id, user.id)
+            buffer.record(file.id, user.id)
+        buffer.record(file.id, user.id)  # Reaches the batch size and flushes
+        buffer.record(file.id + 1000)  # Unknown file, dropped on flush
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(FileAccessEvent.objects.count(), 3)
+
+        self.assertEqual(aggregate_access_events(batch_size=2), 3)
+        file.refresh_from_db()
+        self.assertEqual(file.download_count, 3)
+        self.assertIsNotNone(file.last_accessed_at)
+        self.assertFalse(FileAccessEvent.objects.exists())
+
+    @override_settings(S3CONNECTOR_READ_REPLICAS=['replica0'])
+    def test_reads_stay_on_primary(self):
+        # 'replica0' is not a configured database: any read routed there raises
+        user = User.objects.create_user('owner', password='pw')
+        file = File.objects.create(
+            name='a.txt', original_name='a.txt', s3_key='uploads/a.txt',
+            size=1, content_type='text/plain', owner=user,
+        )
+        buffer = AccessLogBuffer(background=False)
+        buffer.record(file.id, user.id)
+
+        def in_fresh_request(function):
+            return contextvars.Context().run(function)
+
+        self.assertEqual(in_fresh_request(buffer.flush), 1)
+        self.assertEqual(in_fresh_request(aggregate_access_events), 1)
+
+
+class BatchUploadTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pw')
+        UserProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def fake_upload(self, file_obj, filename, digest=None, **kwargs):
+        return {
+            "success": True,
+            "message": f"Successfully uploaded {filename}",
+            "file_info": {
+                "key": f"uploads/{filename}",
+                "content_type": digest.content_type,
+                "size_bytes": file_obj.size,
+                "checksum_sha256": digest.sha256,
+                "checksum_crc32": digest.crc32,
+            },
+        }
+
+    def post(self, data):
+        with mock.patch('s3connector.s3utils.S3Uploader') as uploader:
+            uploader.return_value.upload.side_effect = self.fake_upload
+            return self.client.post('/upload/batch/', data)
+
+    def test_multiple_files(self):
+        files = [SimpleUploadedFile(name, b'hello') for name in ('a.txt', 'b.txt', 'a.txt')]
+        response = self.post({'files': files})
+        self.assertEqual(response.json()['uploaded'], 3)
+        self.assertEqual(
+            sorted(File.objects.values_list('original_name', flat=True)),
+            ['a.txt', 'a_1.txt', 'b.txt']
+        )
+
+    def test_unique_names(self):
+        items = [BatchItem(name, 1, None) for name in ('a.txt', 'a.txt', 'a_1.txt', 'a.txt', 'README', 'README')]
+        self.assertEqual(
+            [item.name for item in unique_names(items)],
+            ['a.txt', 'a_2.txt', 'a_1.txt', 'a_3.txt', 'README', 'README_1']
+        )
+
+    def test_zip_archive(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('project/readme.txt', b'read me')
+            archive.writestr('project/logo.png', b'\x89PNG\r\n\x1a\n' + b'0' * 32)
+            archive.writestr('project/empty/', b'')
+        response = self.post({'archive': SimpleUploadedFile('project.zip', buffer.getvalue())})
+        body = response.json()
+        self.assertEqual(body['uploaded'], 2)
+        logo = File.objects.get(original_name='logo.png')
+        self.assertEqual(logo.category, 'image')
+        self.assertEqual(logo.size, 40)
+        self.assertEqual((logo.folder.name, logo.folder.parent), ('project', None))
+
+    def test_archive_keeps_folders_and_reports_skipped(self):
+        inbox = Folder.objects.create(name='inbox', owner=self.user)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('src/__init__.py', b'# src')
+            archive.writestr('tests/__init__.py', b'# tests')
+            archive.writestr('.gitignore', b'*.pyc')
+            archive.writestr('../escape.txt', b'no')
+        response = self.post({'archive': SimpleUploadedFile('p.zip', buffer.getvalue()), 'folder': inbox.id})
+        results = response.json()['results']
+
+        self.assertEqual(
+            [(result['name'], result['message']) for result in results],
+            [('src/__init__.py', 'Successfully uploaded __init__.py'),
+             ('tests/__init__.py', 'Successfully uploaded __init___1.py'),
+             ('.gitignore', 'skipped'), ('escape.txt', 'skipped')]
+        )
+        self.assertEqual(results[2]['reason'], 'hidden file')
+        files = File.objects.order_by('id')
+        self.assertEqual(
+            [(f.original_name, f.folder.name, f.folder.parent_id, f.s3_key) for f in files],
+            [('__init__.py', 'src', inbox.id, 'uploads/__init__.py'),
+             ('__init__.py', 'tests', inbox.id, 'uploads/__init___1.py')]
+        )
+
+    def test_quota_checked_once_for_batch(self):
+        self.user.profile.storage_quota = 8
+        self.user.profile.save()
+        files = [SimpleUploadedFile(name, b'hello') for name in ('a.txt', 'b.txt')]
+        response = self.post({'files': files})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(File.objects.exists())
+
+
+class FolderZipTests(TestCase):
+
+    def test_streams_folder_tree(self):
+        user = User.objects.create_user('owner', password='pw')
+        root = Folder.objects.create(name='project', owner=user)
+        docs = Folder.objects.create(name='docs', owner=user, parent=root)
+        contents = {}
+        for folder, name in ((root, 'main.py'), (docs, 'guide.txt'), (None, 'outside.txt')):
+            data = name.encode() * 1000
+            contents[f"uploads/{name}"] = data
+            File.objects.create(
+                name=name, original_name=name, s3_key=f"uploads/{name}", size=len(data),
+                content_type='text/plain', owner=user, folder=folder,
+            )
+
+        def fake_stream(key, chunk_size, s3_client=None):
+            data = contents[key]
+            for start in range(0, len(data), 1000):
+                yield data[start:start + 1000]
+
+        self.client.force_login(user)
+        with mock.patch('s3connector.s3utils.get_s3_client'), \
+                mock.patch('s3connector.s3utils.stream_file_from_s3', fake_stream):
+            response = self.client.get(f'/folders/{root.id}/download/')
+            body = b''.join(response.streaming_content)
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="project.zip"')
+        archive = zipfile.ZipFile(io.BytesIO(body))
+        self.assertEqual(sorted(archive.namelist()), ['docs/guide.txt', 'main.py'])
+        self.assertEqual(archive.read('docs/guide.txt'), contents['uploads/guide.txt'])
+
+    def test_unsafe_folder_name(self):
+        user = User.objects.create_user('owner', password='pw')
+        folder = Folder.objects.create(name='a "b"\nc', owner=user)
+        self.client.force_login(user)
+        with mock.patch('s3connector.s3utils.get_s3_client'):
+            response = self.client.get(f'/folders/{folder.id}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], "attachment; filename*=utf-8''a%20%22b%22%0Ac.zip")
+
+
+class FileTransferTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pw')
+        UserProfile.objects.create(user=self.user, storage_quota=2000)
+        self.other = User.objects.create_user('other', password='pw')
+        UserProfile.objects.create(user=self.other, storage_quota=1000)
+        self.file = File.objects.create(
+            name='a.txt', original_name='a.txt', s3_key='uploads/a.txt', size=600,
+            content_type='text/plain', category='document', owner=self.user,
+        )
+
+    @mock.patch('s3connector.s3utils.get_s3_client')
+    @mock.patch('s3connector.s3utils.copy_object_in_s3', return_value=True)
+    def test_duplicate(self, copy_object, get_client):
+        first = copy_file(self.file)
+        second = copy_file(self.file)
+        self.assertTrue(first['success'] and second['success'])
+        self.assertEqual(first['file'].category, 'document')
+        # Copies made in the same second must not share (and overwrite) a key
+        keys = [call.args[1] for call in copy_object.call_args_list]
+        self.assertEqual(keys, [first['file'].s3_key, second['file'].s3_key])
+        self.assertNotEqual(keys[0], keys[1])
+        self.assertRegex(keys[0], r'^uploads/a_[0-9a-f]{12}\.txt$')
+
+    @mock.patch('s3connector.s3utils.copy_object_in_s3')
+    def test_copy_over_quota(self, copy_object):
+        self.assertTrue(File.objects.create(
+            name='b', original_name='b', s3_key='uploads/b', size=600, content_type='x', owner=self.other,
+        ))
+        result = copy_file(self.file, owner=self.other)
+        self.assertFalse(result['success'])
+        copy_object.assert_not_called()
+
+    def test_copy_storage_errors(self):
+        s3_client = mock.Mock()
+        for error in (EndpointConnectionError(endpoint_url='https://s3'), S3TransferFailedError('part failed')):
+            s3_client.copy.side_effect = error
+            self.assertFalse(copy_object_in_s3('uploads/a.txt', 'uploads/b.txt', s3_client))
+
+    def test_recipient_without_profile(self):
+        stranger = User.objects.create_user('stranger', password='pw')
+        self.assertFalse(copy_file(self.file, owner=stranger)['success'])
+        self.assertFalse(move_file(self.file, owner=stranger)['success'])
+        self.file.refresh_from_db()
+        self.assertEqual(self.file.owner, self.user)
+
+    @mock.patch('s3connector.s3utils.get_s3_client')
+    @mock.patch('s3connector.s3utils.copy_object_in_s3', return_value=True)
+    def test_send_only_to_users_shared_with(self, copy_object, get_client):
+        self.client.force_login(self.user)
+        inbox = Folder.objects.create(name='inbox', owner=self.other)
+        self.client.post(f'/files/{self.file.id}/copy/', {'username': 'other'})
+        self.client.post(f'/files/{self.file.id}/move/', {'username': 'other'})
+        self.assertFalse(self.other.files.exists())
+
+        permission = FilePermission.objects.create(file=self.file, permission_type='shared')
+        permission.shared_users.add(self.other)
+        self.client.post(f'/files/{self.file.id}/copy/', {'username': 'other', 'folder': inbox.id})
+        self.assertFalse(self.other.files.exists())  # Not into the recipient's folders
+        self.client.post(f'/files/{self.file.id}/copy/', {'username': 'other'})
+        self.assertEqual(self.other.files.get().folder, None)
+        copy_object.assert_called_once()
+
+    def test_move_to_other_user(self):
+        folder = Folder.objects.create(name='inbox', owner=self.other)
+        result = move_file(self.file, owner=self.other, folder=folder)
+        self.assertTrue(result['success'])
+        self.file.refresh_from_db()
+        self.assertEqual((self.file.owner, self.file.folder), (self.other, folder))
+
+
+class AdmissionTests(TestCase):
+
+    def test_controller_limits(self):
+        controller = AdmissionController({'user_uploads': 1, 'global_bytes': 100})
+        self.assertTrue(controller.try_acquire(1, 60))
+        self.assertFalse(controller.try_acquire(1, 10))  # Per-user slot taken
+        self.assertFalse(controller.try_acquire(2, 50))  # Global bytes exceeded
+        self.assertTrue(controller.try_acquire(2, 40))
+        controller.release(1, 60)
+        self.assertEqual(controller.snapshot()['bytes_in_flight'], 40)
+        self.assertEqual(controller.snapshot()['rejected_total'], 2)
+
+    def test_rejects_before_reading_body(self):
+        user = User.objects.create_user('owner', password='pw')
+        self.client.force_login(user)
+        busy = AdmissionController({'user_uploads': 0})
+        with mock.patch('s3connector.admission.controller', busy):
+            response = self.client.post('/upload/', {'file': SimpleUploadedFile('a.txt', b'hello')})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '5')
+
+
+class PreviewTests(SimpleTestCase):
+
+    def setUp(self):
+        self.file = File(original_name='data.csv', content_type='text/csv', s3_key='uploads/data.csv')
+
+    def test_middle_page_drops_partial_lines(self):
+        data = 'a;b\n1;2\n3;4\n5;6'.encode()
+        preview = render_preview(self.file, {'data': data[2:13], 'start': 2, 'total_size': len(data)})
+        self.assertEqual(preview['lines'], ['1;2', '3;4'])
+        self.assertEqual(preview['rows'], [['1', '2'], ['3', '4']])
+        self.assertEqual(preview['next_start'], 12)
+        self.assertEqual(preview['prev_start'], 0)
+
+    def test_encodings(self):
+        self.assertEqual(detect_encoding('ütf'.encode('utf-8')[1:]), ('utf-8', 0))
+        self.assertEqual(detect_encoding('caf\xe9 noir'.encode('cp1252')), ('cp1252', 0))
+        self.assertEqual(detect_encoding(codecs.BOM_UTF16_LE + 'hi'.encode('utf-16-le')), ('utf-16-le', 2))
+        self.assertEqual(detect_encoding(b'\x89PNG\x00\x00\x01\x02'), (None, 0))
+
+    def test_utf16_range_without_newline(self):
+        data = ('x' * 40).encode('utf-16-le')
+        preview = render_preview(self.file, {'data': data[10:30], 'start': 10, 'total_size': len(data)})
+        self.assertEqual(preview['encoding'], 'utf-16-le')
+        self.assertEqual(preview['lines'], ['x' * 10])
+
+    def test_utf16_odd_start(self):
+        data = 'ab\ncd\nef\ngh\n'.encode('utf-16-be')
+        self.assertEqual(detect_encoding(data[3:], offset=3), ('utf-16-be', 1))
+        preview = render_preview(self.file, {'data': data[3:21], 'start': 3, 'total_size': len(data)})
+        self.assertEqual(preview['lines'], ['cd', 'ef'])
+        self.assertEqual(preview['start'], 6)
+        self.assertEqual(preview['next_start'], 18)
+
+    @override_settings(S3CONNECTOR_PREVIEW_BYTES=8)
+    def test_cached_per_etag(self):
+        chunk = {'data': b'x,y\n1,2\n', 'start': 0, 'total_size': 8, 'etag': '"abc"'}
+        cache.clear()
+        with mock.patch('s3connector.s3utils.fetch_range_from_s3', return_value=chunk) as fetch:
+            first = get_preview(self.file)
+            second = get_preview(self.file)
+        fetch.assert_called_once_with('uploads/data.csv', 0, 8)
+        self.assertEqual(first, second)
+
+
+class ApiConditionalTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pw')
+        UserProfile.objects.create(user=self.user)
+        File.objects.create(
+            name='a.txt', original_name='a.txt', s3_key='uploads/a.txt', size=10,
+            content_type='text/plain', owner=self.user,
+        )
+        self.factory = RequestFactory()
+
+    def get(self, view, **headers):
+        request = self.factory.get('/', headers=headers)
+        request.user = self.user
+        return view(request)
+
+    def test_not_modified_costs_one_query(self):
+        response = self.get(views.api_files_view)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['files'][0]['name'], 'a.txt')
+
+        with query_budget(1):
+            response = self.get(views.api_files_view, if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_storage_not_modified_costs_one_query(self):
+        etag = self.get(views.api_storage_view)['ETag']
+        with query_budget(1):
+            response = self.get(views.api_storage_view, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.user.profile.storage_quota += 1
+        self.user.profile.save()
+        self.user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(self.get(views.api_storage_view, if_none_match=etag).status_code, 200)
+
+    def test_etag_changes_on_delete(self):
+        etag = self.get(views.api_storage_view)['ETag']
+        File.objects.all().delete()
+        response = self.get(views.api_storage_view, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['used_storage'], 0)
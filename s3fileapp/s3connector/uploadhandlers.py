@@ -0,0 +1,179 @@
+import base64
+import hashlib
+import mimetypes
+import zlib
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+# (offset, signature, content type) - checked in order, first match wins
+MAGIC_SIGNATURES = [
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'BM', 'image/bmp'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (0, b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'\xff\xfb', 'audio/mpeg'),
+    (0, b'\xff\xf3', 'audio/mpeg'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'fLaC', 'audio/flac'),
+    (0, b'\x1aE\xdf\xa3', 'video/webm'),
+    (4, b'ftypqt', 'video/quicktime'),
+    (4, b'ftypM4A', 'audio/mp4'),
+    (4, b'ftyp', 'video/mp4'),
+]
+
+# RIFF containers carry their real format at offset 8
+RIFF_FORMATS = {
+    b'WEBP': 'image/webp',
+    b'WAVE': 'audio/wav',
+    b'AVI ': 'video/x-msvideo',
+}
+
+# Signatures of two or three printable bytes also start ordinary text ("BMW,...",
+# "ID3 notes"), so they only win when the filename has no opinion or agrees
+WEAK_SIGNATURES = {b'BM', b'ID3', b'\xff\xfb', b'\xff\xf3'}
+
+# Container formats whose filename guess is more specific than the magic bytes
+# (e.g. .docx/.xlsx are zip files, .doc/.xls are OLE storage files)
+GENERIC_CONTAINERS = {'application/zip', 'application/x-ole-storage'}
+
+# Enough bytes to cover every signature above
+SNIFF_LENGTH = 16
+
+
+def sniff_content_type(head, filename=None):
+    """
+    Determine the content type from the leading bytes of a file
+
+    Args:
+        head: The first bytes of the file (at least SNIFF_LENGTH for a reliable match)
+        filename: Optional filename used to refine generic containers and as a fallback
+
+    Returns:
+        str: The detected content type
+    """
+    guessed = None
+    if filename:
+        guessed, _ = mimetypes.guess_type(filename)
+
+    sniffed = None
+    weak = False
+    if head[:4] == b'RIFF':
+        sniffed = RIFF_FORMATS.get(head[8:12])
+    else:
+        for offset, signature, content_type in MAGIC_SIGNATURES:
+            if head[offset:offset + len(signature)] == signature:
+                sniffed = content_type
+                weak = signature in WEAK_SIGNATURES
+                break
+
+    if guessed and sniffed in GENERIC_CONTAINERS:
+        return guessed
+    if guessed and weak and guessed.split('/')[0] != sniffed.split('/')[0]:
+        return guessed
+    return sniffed or guessed or 'application/octet-stream'
+
+
+class UploadDigest:
+    """Checksums, size and sniffed content type gathered in a single pass over a file"""
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._crc32 = 0
+        self._head = b''
+        self._content_type = None
+
+    def update(self, chunk):
+        """Feed the next chunk of the file"""
+        if len(self._head) < SNIFF_LENGTH:
+            self._head += chunk[:SNIFF_LENGTH - len(self._head)]
+        self._sha256.update(chunk)
+        self._crc32 = zlib.crc32(chunk, self._crc32)
+        self.size += len(chunk)
+
+    @property
+    def sha256(self):
+        """Hex encoded SHA-256 of the whole file"""
+        return self._sha256.hexdigest()
+
+    @property
+    def crc32(self):
+        """Base64 encoded big-endian CRC32, the format S3 expects for ChecksumCRC32"""
+        return base64.b64encode(self._crc32.to_bytes(4, 'big')).decode('ascii')
+
+    @property
+    def content_type(self):
+        """Content type sniffed from the magic bytes, refined by the filename"""
+        if self._content_type is None:
+            self._content_type = sniff_content_type(self._head, self.filename)
+        return self._content_type
+
+    @classmethod
+    def from_file(cls, file_obj, filename=None):
+        """Build a digest by reading an already received file (fallback when the handler is not installed)"""
+        digest = cls(filename or getattr(file_obj, 'name', None))
+        for chunk in file_obj.chunks():
+            digest.update(chunk)
+        file_obj.seek(0)
+        return digest
+
+
+class ChecksumUploadHandler(FileUploadHandler):
+    """
+    Upload handler that inspects every chunk as Django receives it and passes it on unchanged
+
+    Must be listed before the handlers that store the file (see FILE_UPLOAD_HANDLERS)
+    so the digest is ready by the time the view sees request.FILES.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}
+        self._current = None
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self._current = UploadDigest(file_name)
+
+    def receive_data_chunk(self, raw_data, start):
+        self._current.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests.setdefault(self.field_name, []).append(self._current)
+        self._current = None
+        # Let the next handler build the UploadedFile
+        return None
+
+
+def get_upload_digest(request, field_name, uploaded_file, index=0):
+    """
+    Return the UploadDigest for an uploaded file
+
+    Args:
+        request: The request the file was uploaded with
+        field_name: The form field holding the file
+        uploaded_file: The UploadedFile from request.FILES
+        index: Position of the file in request.FILES.getlist(field_name)
+
+    Returns:
+        UploadDigest: Collected during upload, or computed now if the handler did not run
+    """
+    for handler in request.upload_handlers:
+        if isinstance(handler, ChecksumUploadHandler):
+            digests = handler.digests.get(field_name, [])
+            if index < len(digests) and digests[index].size == uploaded_file.size:
+                return digests[index]
+    return UploadDigest.from_file(uploaded_file)
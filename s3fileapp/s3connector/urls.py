@@ -0,0 +1,38 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    # Authentication
+    path('register/', views.register, name='register'),
+    path('login/', views.login_view, name='login'),
+    path('logout/', views.logout_view, name='logout'),
+
+    # Dashboard
+    path('', views.dashboard_view, name='dashboard'),
+
+    # Files
+    path('upload/', views.upload_file_view, name='upload_file'),
+    path('upload/batch/', views.batch_upload_view, name='batch_upload'),
+    path('upload/stats/', views.upload_stats_view, name='upload_stats'),
+    path('files/', views.file_list_view, name='file_list'),
+    path('files/category/<str:category>/', views.file_list_view, name='file_list_category'),
+    path('files/search/', views.search_view, name='search'),
+    path('files/<int:file_id>/', views.file_detail_view, name='file_detail'),
+    path('files/<int:file_id>/download/', views.download_file_view, name='download_file'),
+    path('files/<int:file_id>/preview/', views.file_preview_view, name='file_preview'),
+    path('files/<int:file_id>/delete/', views.delete_file_view, name='delete_file'),
+    path('files/<int:file_id>/copy/', views.copy_file_view, name='copy_file'),
+    path('files/<int:file_id>/move/', views.move_file_view, name='move_file'),
+
+    # Folders
+    path('folders/create/', views.create_folder_view, name='create_folder'),
+    path('folders/<int:folder_id>/', views.folder_view, name='folder'),
+    path('folders/<int:folder_id>/download/', views.download_folder_view, name='download_folder'),
+    path('folders/<int:folder_id>/delete/', views.delete_folder_view, name='delete_folder'),
+
+    # JSON API
+    path('api/files/', views.api_files_view, name='api_files'),
+    path('api/folders/', views.api_folders_view, name='api_folders'),
+    path('api/storage/', views.api_storage_view, name='api_storage'),
+]
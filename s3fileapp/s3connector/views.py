@@ -2,8 +2,13 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import login,  logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from .models import UserProfile
+from django.core.exceptions import PermissionDenied
+from django.views.decorators.http import condition
+from .admission import upload_admission
+from .routers import replica_reads
+from .models import UserProfile, File
 
 # Create your views here.
 def register(request):
@@ -49,27 +54,33 @@ def logout_view(request):
 @login_required
 def dashboard_view(request):
     """Display user dashboard with storage usage and files"""
-    # Get user profile for storage info
-    profile = request.user.profile
-    used_storage = profile.get_used_storage()
-    total_storage = profile.storage_quota
-    storage_percentage = (used_storage / total_storage) * 100 if total_storage > 0 else 0
-    
-    # Get user's files and folders
-    files = request.user.files.all().order_by('-uploaded_at')
-    folders = request.user.folders.filter(parent=None).order_by('name')
+    def build_context():
+        # Get user profile for storage info
+        profile = request.user.profile
+        used_storage = profile.get_used_storage()
+        total_storage = profile.storage_quota
+        storage_percentage = (used_storage / total_storage) * 100 if total_storage > 0 else 0
+        
+        # Get user's files and folders
+        files = request.user.files.select_related('folder', 'permission').order_by('-uploaded_at')
+        folders = request.user.folders.filter(parent=None).order_by('name')
+        
+        return {
+            'files': list(files),
+            'folders': list(folders),
+            'used_storage': used_storage,
+            'total_storage': total_storage,
+            'storage_percentage': storage_percentage,
+        }
     
-    context = {
-        'files': files,
-        'folders': folders,
-        'used_storage': used_storage,
-        'total_storage': total_storage,
-        'storage_percentage': storage_percentage,
-    }
+    # Reused until the user's next upload, delete, folder or permission change
+    from .cache import cached_for_user
+    context = cached_for_user(request.user.id, 'dashboard', build_context)
     return render(request, 's3connector/dashboard.html', context)
 
 # File Upload View
 @login_required
+@upload_admission
 def upload_file_view(request):
     """Handle file uploads"""
     if request.method == 'POST':
@@ -94,10 +105,14 @@ def upload_file_view(request):
             except:
                 messages.warning(request, "Selected folder not found.")
         
+        # Checksums and sniffed type were collected while the upload streamed in
+        from .uploadhandlers import get_upload_digest
+        digest = get_upload_digest(request, 'file', file)
+        
         # Upload file to S3
         from .s3utils import S3Uploader
         uploader = S3Uploader()
-        result = uploader.upload(file, file.name)
+        result = uploader.upload(file, file.name, digest=digest)
         
         if result['success']:
             # Create File record in database
@@ -105,15 +120,7 @@ def upload_file_view(request):
             
             # Determine file category based on content type
             content_type = result['file_info']['content_type']
-            category = 'other'
-            if content_type.startswith('image/'):
-                category = 'image'
-            elif content_type.startswith('video/'):
-                category = 'video'
-            elif content_type.startswith('audio/'):
-                category = 'audio'
-            elif 'pdf' in content_type or 'document' in content_type or 'spreadsheet' in content_type:
-                category = 'document'
+            category = File.category_for_content_type(content_type)
             
             # Create the file record
             File.objects.create(
@@ -123,6 +130,8 @@ def upload_file_view(request):
                 size=result['file_info']['size_bytes'],
                 content_type=content_type,
                 category=category,
+                checksum_sha256=result['file_info'].get('checksum_sha256', ''),
+                checksum_crc32=result['file_info'].get('checksum_crc32', ''),
                 owner=request.user,
                 folder=folder
             )
@@ -138,14 +147,72 @@ def upload_file_view(request):
     return render(request, 's3connector/upload.html', {'folders': folders})
 
 @login_required
+@upload_admission
+def batch_upload_view(request):
+    """Upload many files, or the contents of a zip/tar archive, in one request"""
+    if request.method == 'POST':
+        from django.http import JsonResponse
+        from .batch import archive_items, upload_batch, uploaded_file_items
+        from .uploadhandlers import get_upload_digest
+        
+        files = request.FILES.getlist('files')
+        archive = request.FILES.get('archive')
+        
+        if archive:
+            try:
+                items = archive_items(archive)
+            except Exception as e:
+                return JsonResponse({'error': f"Could not read archive: {e}"}, status=400)
+        else:
+            digests = [get_upload_digest(request, 'files', f, index=i) for i, f in enumerate(files)]
+            items = list(uploaded_file_items(files, digests))
+        
+        if not items:
+            return JsonResponse({'error': "No files were selected."}, status=400)
+        
+        # One quota check for the whole batch
+        batch_size = sum(item.size for item in items)
+        if batch_size > request.user.profile.get_available_storage():
+            return JsonResponse({'error': "Not enough storage available."}, status=400)
+        
+        folder = None
+        folder_id = request.POST.get('folder')
+        if folder_id:
+            folder = request.user.folders.filter(id=folder_id).first()
+        
+        results = upload_batch(request.user, items, folder=folder)
+        uploaded = sum(1 for result in results if result['success'])
+        return JsonResponse({
+            'uploaded': uploaded,
+            'failed': len(results) - uploaded,
+            'results': results,
+        })
+    
+    # GET request - show batch upload form
+    folders = request.user.folders.all()
+    return render(request, 's3connector/batch_upload.html', {'folders': folders})
+
+@staff_member_required
+def upload_stats_view(request):
+    """Upload admission counters for monitoring"""
+    from django.http import JsonResponse
+    from .admission import controller
+    return JsonResponse(controller.snapshot())
+
+@login_required
+@replica_reads
 def file_list_view(request, category=None):
     """List files, optionally filtered by category"""
-    files_query = request.user.files.all()
-    
-    if category and category != 'all':
-        files_query = files_query.filter(category=category)
+    def build_files():
+        files_query = request.user.files.select_related('folder', 'permission')
+        
+        if category and category != 'all':
+            files_query = files_query.filter(category=category)
+        
+        return list(files_query.order_by('-uploaded_at'))
     
-    files = files_query.order_by('-uploaded_at')
+    from .cache import cached_for_user
+    files = cached_for_user(request.user.id, f"file_list:{category or 'all'}", build_files)
     
     context = {
         'files': files,
@@ -154,6 +221,57 @@ def file_list_view(request, category=None):
     }
     return render(request, 's3connector/file_list.html', context)
 
+def _int_param(request, name):
+    """Read an optional integer query parameter, ignoring bad values"""
+    try:
+        return int(request.GET[name])
+    except (KeyError, ValueError):
+        return None
+
+def _date_param(request, name, days=0):
+    """
+    Read an optional YYYY-MM-DD query parameter as the aware start of that day (plus days), ignoring bad values
+    """
+    import datetime
+    from django.utils import timezone
+    from django.utils.dateparse import parse_date
+    try:
+        day = parse_date(request.GET.get(name, ''))
+    except ValueError:
+        return None
+    if day is None:
+        return None
+    return timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=days), datetime.time.min))
+
+@login_required
+@replica_reads
+def search_view(request):
+    """Search the user's files by name with category, type, size and date filters"""
+    from .search import search_files
+    
+    filters = {
+        'query': request.GET.get('q', ''),
+        'prefix': request.GET.get('prefix') == '1',
+        'category': request.GET.get('category') or None,
+        'content_type': request.GET.get('content_type') or None,
+        'min_size': _int_param(request, 'min_size'),
+        'max_size': _int_param(request, 'max_size'),
+        'uploaded_after': _date_param(request, 'after'),
+        # Inclusive: files uploaded on the 'before' day itself still match
+        'uploaded_before': _date_param(request, 'before', days=1),
+    }
+    result = search_files(request.user, page=request.GET.get('page', 1), **filters)
+    
+    context = {
+        'files': result['page'],
+        'page': result['page'],
+        'total': result['total'],
+        'facets': result['facets'],
+        'filters': filters,
+        'categories': [choice[0] for choice in File.CATEGORY_CHOICES]
+    }
+    return render(request, 's3connector/search.html', context)
+
 @login_required
 def file_detail_view(request, file_id):
     """View details of a specific file"""
@@ -165,6 +283,27 @@ def file_detail_view(request, file_id):
         messages.error(request, "File not found.")
         return redirect('file_list')
 
+@login_required
+def file_preview_view(request, file_id):
+    """Preview a page of a text, CSV or log file fetched with a ranged GET"""
+    try:
+        file = request.user.files.select_related('folder', 'permission').get(id=file_id)
+    except:
+        messages.error(request, "File not found.")
+        return redirect('file_list')
+    
+    from .preview import get_preview
+    tail = request.GET.get('from') == 'tail'
+    start = max(_int_param(request, 'start') or 0, 0)
+    try:
+        preview = get_preview(file, start=start, tail=tail)
+    except Exception as e:
+        messages.error(request, f"Error previewing file: {str(e)}")
+        return redirect('file_detail', file_id=file_id)
+    
+    context = {'file': file, 'preview': preview}
+    return render(request, 's3connector/file_preview.html', context)
+
 @login_required
 def delete_file_view(request, file_id):
     """Delete a file"""
@@ -187,6 +326,91 @@ def delete_file_view(request, file_id):
         
     return redirect('file_list')
 
+def _transfer_target(request, file):
+    """
+    Resolve the target user and folder posted to the copy and move views
+    
+    Files can only be sent to users they are already shared with, and only into
+    the recipient's root; anything else raises PermissionDenied.
+    """
+    from django.contrib.auth.models import User
+    from .models import FilePermission
+    
+    owner = request.user
+    username = request.POST.get('username')
+    if username and username != request.user.username:
+        owner = User.objects.get(username=username)
+        shared = FilePermission.objects.filter(file=file, permission_type='shared', shared_users=owner).exists()
+        if not shared or request.POST.get('folder'):
+            raise PermissionDenied
+    
+    folder = None
+    folder_id = request.POST.get('folder')
+    if folder_id:
+        folder = owner.folders.get(id=folder_id)
+    return owner, folder
+
+@login_required
+def copy_file_view(request, file_id):
+    """Copy a file server-side; with no target this duplicates it in place"""
+    if request.method != 'POST':
+        return redirect('file_detail', file_id=file_id)
+    try:
+        file = request.user.files.get(id=file_id)
+    except:
+        messages.error(request, "File not found.")
+        return redirect('file_list')
+    
+    try:
+        owner, folder = _transfer_target(request, file)
+    except PermissionDenied:
+        messages.error(request, "Files can only be sent to users they are shared with.")
+        return redirect('file_detail', file_id=file_id)
+    except Exception:
+        messages.error(request, "Destination user or folder not found.")
+        return redirect('file_detail', file_id=file_id)
+    if owner == request.user and not request.POST.get('folder'):
+        folder = file.folder
+    
+    from .fileops import copy_file
+    result = copy_file(file, owner=owner, folder=folder)
+    if result['success']:
+        messages.success(request, result['message'])
+    else:
+        messages.error(request, f"Error copying file: {result['message']}")
+    return redirect('file_detail', file_id=file_id)
+
+@login_required
+def move_file_view(request, file_id):
+    """Move a file to another folder or another user's space"""
+    if request.method != 'POST':
+        return redirect('file_detail', file_id=file_id)
+    try:
+        file = request.user.files.get(id=file_id)
+    except:
+        messages.error(request, "File not found.")
+        return redirect('file_list')
+    
+    try:
+        owner, folder = _transfer_target(request, file)
+    except PermissionDenied:
+        messages.error(request, "Files can only be sent to users they are shared with.")
+        return redirect('file_detail', file_id=file_id)
+    except Exception:
+        messages.error(request, "Destination user or folder not found.")
+        return redirect('file_detail', file_id=file_id)
+    
+    from .fileops import move_file
+    result = move_file(file, owner=owner, folder=folder)
+    if not result['success']:
+        messages.error(request, f"Error moving file: {result['message']}")
+        return redirect('file_detail', file_id=file_id)
+    
+    messages.success(request, result['message'])
+    if owner != request.user:
+        return redirect('file_list')
+    return redirect('file_detail', file_id=file_id)
+
 @login_required
 def download_file_view(request, file_id):
     """Generate download URL and redirect"""
@@ -195,6 +419,9 @@ def download_file_view(request, file_id):
         download_url = file.get_download_url()
         
         if download_url:
+            # Buffered in memory and written in batches, keeping this path read-only
+            from .accesslog import access_log
+            access_log.record(file.id, request.user.id)
             return redirect(download_url)
         else:
             messages.error(request, "Error generating download link.")
@@ -242,23 +469,43 @@ def create_folder_view(request):
     return render(request, 's3connector/create_folder.html', {'folders': folders})
 
 @login_required
+@replica_reads
 def folder_view(request, folder_id):
     """View contents of a folder"""
     try:
-        folder = request.user.folders.get(id=folder_id)
-        files = folder.files.all().order_by('-uploaded_at')
-        subfolders = folder.subfolders.all().order_by('name')
+        def build_context():
+            folder = request.user.folders.get(id=folder_id)
+            return {
+                'folder': folder,
+                'files': list(folder.files.select_related('permission').order_by('-uploaded_at')),
+                'subfolders': list(folder.subfolders.all().order_by('name')),
+            }
         
-        context = {
-            'folder': folder,
-            'files': files,
-            'subfolders': subfolders,
-        }
+        from .cache import cached_for_user
+        context = cached_for_user(request.user.id, f"folder:{folder_id}", build_context)
         return render(request, 's3connector/folder.html', context)
     except:
         messages.error(request, "Folder not found.")
         return redirect('dashboard')
 
+@login_required
+def download_folder_view(request, folder_id):
+    """Stream a zip of a folder and its subfolders straight from S3"""
+    try:
+        folder = request.user.folders.get(id=folder_id)
+    except:
+        messages.error(request, "Folder not found.")
+        return redirect('dashboard')
+    
+    from django.http import StreamingHttpResponse
+    from django.utils.http import content_disposition_header
+    from .zipstream import folder_entries, stream_zip
+    
+    response = StreamingHttpResponse(stream_zip(folder_entries(folder)), content_type='application/zip')
+    # Folder names are free text: quotes and newlines must not break the header
+    response['Content-Disposition'] = content_disposition_header(True, f"{folder.name}.zip")
+    return response
+
 @login_required
 def delete_folder_view(request, folder_id):
     """Delete a folder"""
@@ -280,4 +527,84 @@ def delete_folder_view(request, folder_id):
         return redirect('dashboard')
     except:
         messages.error(request, "Folder not found or cannot be deleted.")
-        return redirect('dashboard')
\ No newline at end of file
+        return redirect('dashboard')
+
+# JSON API
+# Each endpoint answers If-None-Match from one indexed aggregate, so polling
+# clients that are up to date get a bodyless 304.
+
+def _compact_json(data):
+    from django.http import JsonResponse
+    return JsonResponse(data, json_dumps_params={'separators': (',', ':')})
+
+def _etag(*parts):
+    import hashlib
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+def _api_files(request):
+    """The user's files narrowed by the category and folder query parameters"""
+    files = File.objects.filter(owner=request.user)
+    category = request.GET.get('category')
+    if category:
+        files = files.filter(category=category)
+    folder_id = _int_param(request, 'folder')
+    if folder_id is not None:
+        files = files.filter(folder_id=folder_id)
+    return files
+
+def _files_marker(files):
+    """Count and latest change of a file queryset in one query covered by the (owner, updated_at) index"""
+    from django.db.models import Count, Max
+    return files.order_by().aggregate(count=Count('id'), changed=Max('updated_at'))
+
+def _files_etag(request):
+    marker = _files_marker(_api_files(request))
+    return _etag('files', request.user.id, marker['count'], marker['changed'], request.GET.urlencode())
+
+def _folders_etag(request):
+    from django.db.models import Count, Max
+    marker = request.user.folders.order_by().aggregate(count=Count('id'), changed=Max('created_at'))
+    return _etag('folders', request.user.id, marker['count'], marker['changed'])
+
+def _storage_etag(request):
+    # The quota comes from the same query as the file marker, joined from the profile
+    from django.db.models import Count, Max
+    markers = UserProfile.objects.filter(user=request.user).values('storage_quota').annotate(
+        count=Count('user__files'), changed=Max('user__files__updated_at')
+    )
+    marker = next(iter(markers), {})
+    return _etag('storage', request.user.id, marker.get('count'), marker.get('changed'), marker.get('storage_quota'))
+
+@login_required
+@replica_reads
+@condition(etag_func=_files_etag)
+def api_files_view(request):
+    """List files as JSON; filter with ?category= and ?folder="""
+    files = _api_files(request).order_by('-uploaded_at').values(
+        'id', 'name', 'original_name', 'size', 'content_type', 'category', 'folder_id', 'uploaded_at'
+    )
+    return _compact_json({'files': list(files)})
+
+@login_required
+@replica_reads
+@condition(etag_func=_folders_etag)
+def api_folders_view(request):
+    """List folders as JSON"""
+    folders = request.user.folders.order_by('name').values('id', 'name', 'parent_id', 'created_at')
+    return _compact_json({'folders': list(folders)})
+
+@login_required
+@replica_reads
+@condition(etag_func=_storage_etag)
+def api_storage_view(request):
+    """Storage usage as JSON"""
+    from django.db.models import Count, Sum
+    marker = request.user.files.aggregate(count=Count('id'), total=Sum('size'))
+    used_storage = marker['total'] or 0
+    total_storage = request.user.profile.storage_quota
+    return _compact_json({
+        'used_storage': used_storage,
+        'total_storage': total_storage,
+        'file_count': marker['count'],
+        'storage_percentage': (used_storage / total_storage) * 100 if total_storage > 0 else 0,
+    })
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 's3fileapp.settings')
 
 application = get_asgi_application()
+
+# Only serving processes warm up the S3 connector; management commands skip it
+from django.apps import apps  # noqa: E402
+apps.get_app_config('s3connector').warm_up()
@@ -39,11 +39,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    's3connector.profiling.ProfilingMiddleware',  # First, so it times everything below it
     'django.middleware.security.SecurityMiddleware',
+    's3connector.routers.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    's3connector.admission.AdmissionMiddleware',  # Needs request.user, runs before the body is parsed
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -72,13 +75,119 @@ WSGI_APPLICATION = 's3fileapp.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Connections are kept open between requests and checked before reuse
+CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
+if os.getenv('POSTGRES_DB'):
+    def _postgres(host):
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB'),
+            'USER': os.getenv('POSTGRES_USER'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
+            'HOST': host,
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+
+    DATABASES = {'default': _postgres(os.getenv('POSTGRES_HOST', 'localhost'))}
+
+    # Comma separated replica hosts; s3connector reads are spread across them
+    for i, host in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(','))):
+        DATABASES[f'replica{i}'] = {**_postgres(host.strip()), 'TEST': {'MIRROR': 'default'}}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # WAL lets listing reads run while an upload writes; wait instead of
+                # failing with "database is locked" when two writers collide
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                'timeout': 20,
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
+
+S3CONNECTOR_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+# Seconds a client keeps reading from the primary after it writes
+S3CONNECTOR_REPLICA_PIN_SECONDS = 5
+
+DATABASE_ROUTERS = ['s3connector.routers.ReplicaRouter']
+
+
+# File uploads
+# The checksum handler sees every chunk first, then the default handlers store the file
+
+FILE_UPLOAD_HANDLERS = [
+    's3connector.uploadhandlers.ChecksumUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+
+# Cache
+# Local memory by default, which is per process: cache invalidation only reaches other
+# workers through a shared cache, so set REDIS_URL when running more than one worker
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 's3connector',
+        }
+    }
+
+# Return per-view query/S3/timing counters in the X-S3Connector-Profile header (always logged)
+S3CONNECTOR_PROFILE_HEADER = DEBUG
+
+# Upload admission control, per worker process: concurrent uploads and bytes in flight,
+# globally and per user. Over the limit, uploads get 429 with Retry-After (seconds).
+S3CONNECTOR_UPLOAD_LIMITS = {
+    'global_uploads': 32,
+    'global_bytes': 4 * 1024 * 1024 * 1024,
+    'user_uploads': 4,
+    'user_bytes': 1024 * 1024 * 1024,
+    'retry_after': 5,
 }
 
+# Create the S3 client and load lazily imported modules when each worker starts
+# (from wsgi.py/asgi.py only, so management commands stay fast)
+S3CONNECTOR_WARMUP = os.getenv('S3CONNECTOR_WARMUP', '1') == '1'
+
+# Concurrent S3 transfers per batch upload request
+S3CONNECTOR_BATCH_UPLOAD_WORKERS = 8
+
+# Server-side copies above this size use parallel UploadPartCopy with parts of this size
+S3CONNECTOR_COPY_PART_SIZE = 256 * 1024 * 1024
+S3CONNECTOR_COPY_CONCURRENCY = 16
+
+# Folder zip downloads fetch this many objects ahead, buffering this many 256KB chunks each
+S3CONNECTOR_ZIP_PREFETCH = 4
+S3CONNECTOR_ZIP_RING_SIZE = 4
+
+# Bytes fetched per preview page (ranged GET) for text, CSV and log files
+S3CONNECTOR_PREVIEW_BYTES = 64 * 1024
+
+# Download events are buffered and written in batches of this size, or after this many seconds
+S3CONNECTOR_ACCESS_LOG_BATCH_SIZE = 100
+S3CONNECTOR_ACCESS_LOG_FLUSH_SECONDS = 5.0
+
+# Seconds a cached dashboard/listing context is kept (entries are also invalidated on change)
+S3CONNECTOR_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
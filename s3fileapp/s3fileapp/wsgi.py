@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 's3fileapp.settings')
 
 application = get_wsgi_application()
+
+# Only serving processes warm up the S3 connector; management commands skip it
+from django.apps import apps  # noqa: E402
+apps.get_app_config('s3connector').warm_up()